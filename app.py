@@ -1,15 +1,13 @@
-
-import json
-import socket
-import time
 import pyaudio
 from logger import setup_logging
 
-from device.session import Session
+from client import Client
+from device.echo import EchoReference
+from device.playback import PlaybackEngine
 from device.status import Status
+from device.vad import EnergyVad
 from config.load import load_config
-from ota import OTA
-from protocol.mqtt_protocol import MqttProtocol
+from protocol.event_loop import TransportLoop
 from snowboy import snowboydecoder
 
 
@@ -17,120 +15,68 @@ def main():
     config = load_config()
     logger = setup_logging(config['logger'])
     print("Starting...")
-    session = Session()
-    session.set_state(state=Status.Starting)
+    # UDP、MQTT、OTA 和定时器都在这个事件循环里，音频线程通过线程安全的入口和它交互
+    transport = TransportLoop()
+    transport.start()
     audio = pyaudio.PyAudio()
-    stream_out = audio.open(
-        format=audio.get_format_from_width(2),
-        channels=1,
-        rate=24000,
-        input=False,
-        output=True)
-    stream_out.start_stream()
-
-    def udp_audio_callback(pcm):
-        stream_out.write(pcm)
-
-    def hello_handler(client, msg):
-        session.id = msg['session_id']
-
-        session.udp_server = msg['udp']['server']
-        session.udp_port = msg['udp']['port']
-        session.udp_encryption = msg['udp']['encryption']
-        session.udp_key = msg['udp']['key']
-        session.udp_nonce = msg['udp']['nonce']
-        
-        session.server_audio_params_sample_rate = msg['audio_params']['sample_rate']
-        session.server_audio_params_format = msg['audio_params']['format']
-        session.server_audio_params_channels = msg['audio_params']['channels']
-        session.server_audio_params_frame_duration = msg['audio_params']['frame_duration']
-        
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        client_socket.connect((session.udp_server, session.udp_port))
-        session.udp = client_socket
-        session.set_upd_receive_task(udp_audio_callback)
-        mqtt.send_iot_descriptors(session_id=session.id)
-
-    def goodbye_handler(client, msg):
-        if msg['session_id'] is not None:
-            mqtt.send_goodbye(session_id=msg['session_id'])
-        if session.id == msg['session_id']:
-            session.terminate()
-        detector.restart()
-
-    def tts_handler(client, msg):
-        if msg['state'] == 'start':
-            if session.state == Status.Idle or session.state == Status.Listening:
-                session.set_state(state=Status.Speaking)
-        if msg['state'] == 'stop':
-            if session.state == Status.Speaking:
-                mqtt.send_start_auto_listening(session_id=session.id)
-                time.sleep(1)
-                session.set_state(state=Status.Listening)
-        if msg['state'] == 'sentence_start':
-            m = msg['text']
-            session.display.show_text(f'助手说:{m}')
-
-    def default_handler(client, msg):
-        logger.debug("default_handler: %s", msg)
-
-    def stt_handler(client, msg):
-        m = msg['text']
-        session.display.show_text(f'我说:{m}')
-
-    dispatch_dict = {
-        'hello': hello_handler,
-        'goodbye': goodbye_handler,
-        'tts': tts_handler,
-        'stt': stt_handler,
-        'llm': default_handler,
-        'iot': default_handler,
-    }
-
-    def on_message(client, userdata, msg):
-        # topic = msg.topic
-        m_decode = str(msg.payload.decode("utf-8", "ignore"))
-        msg = json.loads(m_decode)
-        logger.debug("on_message: %s", msg)
-        handler_function = dispatch_dict.get(msg['type'], default_handler)
-        handler_function(client, msg)
-    
-    ota = OTA(config['ota'])
-    server_config = ota.init_server_config()
-
-    mqtt = MqttProtocol(server_config['mqtt'])
-    mqtt.on_message(on_message)
+    # 扬声器播放的参考信号: 回声消除用它处理全部麦克风音频，没开回声消除时打断播报的唤醒词检测减去它
+    barge_in = config['session']['barge_in']
+    echo_cancel = config['audio']['echo_cancel']
+    mic_rate = config['audio']['opus']['sample_rate']
+    playback_rate = config['audio']['playback']['sample_rate']
+    echo_reference = None
+    echo_canceller = None
+    if echo_cancel['enabled'] or (barge_in['enabled'] and barge_in['echo_reference']):
+        echo_reference = EchoReference(barge_in, rate=playback_rate, mic_rate=mic_rate)
+    if echo_cancel['enabled']:
+        # 需要 numpy，只在开启时导入
+        from device.echo_cancel import EchoCanceller
+        echo_canceller = EchoCanceller(echo_reference, echo_cancel, mic_rate=mic_rate)
+    playback = PlaybackEngine(audio, config['audio']['playback'], rate=playback_rate,
+                              echo_reference=echo_reference)
+    playback.start()
+
+    vad_config = config['snowboy']['vad']
+    vad = None
+    if vad_config['enabled']:
+        vad = EnergyVad(
+            energy_threshold=vad_config['energy_threshold'],
+            hangover_ms=vad_config['hangover_ms'])
     detector = snowboydecoder.HotwordDetector(
         decoder_model=config['snowboy']['detector_model'],
-        sensitivity=config['snowboy']['sensitivity']
+        sensitivity=config['snowboy']['sensitivity'],
+        vad=vad,
+        vad_lookback_ms=vad_config['lookback_ms'],
+        echo_reference=echo_reference if echo_canceller is None else None,
+        echo_canceller=echo_canceller
         )
-    
-    def detected_callback(data):
-        if session.state == Status.Idle:
-            mqtt.send_hello()
-            while session.udp is None:
-                time.sleep(0.01)
-            session.upd_send_8(data)
-            mqtt.send_wake_word_detected(
-                session_id=session.id,
-                wake_word=config['snowboy']['wake_word']
-                )
-            session.set_state(state=Status.Listening)
-            mqtt.send_iot_states(session_id=session.id)
 
-    session.set_state(state=Status.Idle)
+    client = Client(config, transport, output=playback.write, flush_output=playback.flush,
+                    restart=detector.restart, rearm=detector.restart)
+    session = client.session
+    session.set_state(state=Status.Starting)
+
+    transport.run(client.start())
 
-    def audio_callback(data):
-        if session.state == Status.Listening:
-            session.upd_send_8(data)
+    def detected_callback():
+        # 空闲时唤醒，播报中打断
+        client.wake()
 
+    session.uplink_pipeline.start()
     detector.start(detected_callback=detected_callback,
-                  sleep_time=0.03,
-                  audio_callback=audio_callback
+                  audio_callback=session.uplink_pipeline.push,
+                  chunk_ms=config['snowboy']['chunk_ms']
                   )
 
     detector.terminate()
+    session.uplink_pipeline.stop()
+    client.stop()
+    transport.stop()
+    playback.stop()
+    logger.info("playback %s", playback.stats)
+    if echo_canceller is not None:
+        logger.info("echo cancel %s", echo_canceller.stats)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,154 @@
+"""
+回声消除离线基准.
+
+把同时录下的 (麦克风 16kHz, 扬声器参考 24kHz) WAV 对按 60ms 一块送入 EchoCanceller，
+参考信号按 20ms 一次的播放回调喂给 EchoReference，时间戳按两段录音同时开始模拟，
+不需要音频设备. 没有给录音时用合成的一对: 参考是类语音信号，麦克风是它经过延迟和房间冲激响应
+后的回声，中间一段叠加近端语音(双讲).
+
+输出每对录音有参考信号时的回声抑制量(ERLE，整体和收敛后的后半段)、合成数据的近端语音保真度、
+每块处理耗时 p50/p99/max 和实时率.
+
+    python -m bench.aec_bench mic.wav:ref.wav ...
+"""
+import argparse
+import time
+import wave
+
+import numpy as np
+
+from config.load import read_config
+from device.audio_source import synthetic_speech
+from device.echo import EchoReference
+from device.echo_cancel import EchoCanceller
+
+MIC_RATE = 16000
+REF_RATE = 24000
+CHUNK_MS = 60
+PLAYBACK_FRAMES = 480
+# 播放回调比实际播放提前多久(声卡输出缓冲)
+PLAYBACK_AHEAD = 0.1
+
+
+def load_wav(path, rate):
+    with wave.open(path, "rb") as wav:
+        if wav.getframerate() != rate or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: 需要 {rate}Hz 单声道 16bit WAV")
+        return np.frombuffer(wav.readframes(wav.getnframes()), np.int16)
+
+
+def synthetic_pair(seconds=12, echo_delay_ms=45, seed=3):
+    """返回 (麦克风, 参考, 近端语音)，都是 int16."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds * REF_RATE) / REF_RATE
+    pitch = 120 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / REF_RATE
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None)
+    far = sum(np.sin(phase * h) / h for h in range(1, 10)) * envelope * 6000
+    far += rng.normal(0, 200, len(far))
+    far = np.clip(far, -32768, 32767).astype(np.int16)
+
+    # 扬声器到麦克风: 16kHz 下的纯延迟加指数衰减的房间冲激响应
+    far16 = np.interp(np.arange(seconds * MIC_RATE) / MIC_RATE, t, far.astype(float))
+    delay = MIC_RATE * echo_delay_ms // 1000
+    tail = rng.normal(0, 1, MIC_RATE * 60 // 1000) * np.exp(-np.arange(MIC_RATE * 60 // 1000) / 120)
+    tail[0] = 3.0
+    # 回声能量是参考信号的四分之一左右
+    impulse = np.concatenate((np.zeros(delay), tail * 0.5 / np.linalg.norm(tail)))
+    echo = np.convolve(far16, impulse)[:len(far16)]
+
+    near = np.zeros(len(far16))
+    speech = np.frombuffer(synthetic_speech(), np.int16)[:MIC_RATE * 2].astype(float)
+    start = MIC_RATE * seconds * 2 // 3
+    near[start:start + len(speech)] = speech
+    mic = echo + near + rng.normal(0, 30, len(far16))
+    return np.clip(mic, -32768, 32767).astype(np.int16), far, near
+
+
+def run_pair(mic, far, config):
+    """按实时的节奏模拟回调，返回处理后的麦克风音频和每块处理耗时."""
+    reference = EchoReference(config['session']['barge_in'], mic_rate=MIC_RATE)
+    canceller = EchoCanceller(reference, config['audio']['echo_cancel'], mic_rate=MIC_RATE)
+    base = 1000.0
+    chunk = MIC_RATE * CHUNK_MS // 1000
+    played = 0
+    output = []
+    timings = []
+    for offset in range(0, len(mic) - chunk + 1, chunk):
+        captured_at = base + (offset + chunk) / MIC_RATE
+        while played < len(far) and base + played / REF_RATE < captured_at + PLAYBACK_AHEAD:
+            reference.feed(far[played:played + PLAYBACK_FRAMES].tobytes(), base + played / REF_RATE)
+            played += PLAYBACK_FRAMES
+        begin = time.perf_counter()
+        cleaned = canceller.process(mic[offset:offset + chunk].tobytes(), captured_at)
+        timings.append(time.perf_counter() - begin)
+        output.append(np.frombuffer(cleaned, np.int16))
+    return np.concatenate(output), np.array(timings), canceller
+
+
+def erle(mic, cleaned, active):
+    mic = mic[:len(cleaned)].astype(float)[active[:len(cleaned)]]
+    cleaned = cleaned.astype(float)[active[:len(cleaned)]]
+    return 10 * np.log10(np.sum(mic * mic) / max(np.sum(cleaned * cleaned), 1.0))
+
+
+def active_mask(far, length, near=None):
+    """参考信号有声音、(合成数据)没有近端语音的采样."""
+    index = np.minimum(np.arange(length) * REF_RATE // MIC_RATE, len(far) - 1)
+    far16 = far[index].astype(float)
+    window = MIC_RATE * 20 // 1000
+    energy = np.convolve(far16 * far16, np.ones(window) / window, mode="same")
+    mask = energy > 300 ** 2
+    if near is not None:
+        mask &= near[:length] == 0
+    return mask
+
+
+def report(name, mic, far, near, config):
+    cleaned, timings, canceller = run_pair(mic, far, config)
+    active = active_mask(far, len(cleaned), near)
+    half = np.zeros(len(cleaned), bool)
+    half[len(cleaned) // 2:] = True
+    line = (f"{name}: ERLE {erle(mic, cleaned, active):5.1f} dB, "
+            f"converged {erle(mic, cleaned, active & half):5.1f} dB")
+    if near is not None:
+        # 双讲段近端语音的保真度: 输出和近端语音的差距
+        talk = near[:len(cleaned)] != 0
+        residual = cleaned[talk].astype(float) - near[:len(cleaned)][talk]
+        fidelity = 10 * np.log10(np.sum(near[:len(cleaned)][talk] ** 2) / np.sum(residual * residual))
+        line += f", near-end SER {fidelity:5.1f} dB"
+    print(line)
+    ms = timings * 1000
+    audio_seconds = len(cleaned) / MIC_RATE
+    print(f"    per {CHUNK_MS} ms chunk p50 {np.percentile(ms, 50):.2f} ms  p99 {np.percentile(ms, 99):.2f} ms  "
+          f"max {ms.max():.2f} ms, real-time factor {timings.sum() / audio_seconds:.4f}, {canceller.stats['frozen']} "
+          f"frozen / {canceller.blocks} blocks")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline echo canceller benchmark")
+    parser.add_argument("pairs", nargs="*", help="mic.wav:ref.wav，麦克风 16kHz、参考 24kHz，同时开始录制")
+    parser.add_argument("--config_path", type=str, default="./config/default.yml")
+    parser.add_argument("--step", type=float, help="覆盖配置里的 step")
+    parser.add_argument("--filter-ms", type=int, help="覆盖配置里的 filter_ms")
+    args = parser.parse_args()
+
+    config = read_config(args.config_path)
+    echo_cancel = config['audio']['echo_cancel']
+    if args.step is not None:
+        echo_cancel['step'] = args.step
+    if args.filter_ms is not None:
+        echo_cancel['filter_ms'] = args.filter_ms
+    print(f"block {echo_cancel['block_ms']} ms, filter {echo_cancel['filter_ms']} ms, step {echo_cancel['step']}")
+
+    if not args.pairs:
+        mic, far, near = synthetic_pair()
+        report("synthetic", mic, far, near, config)
+        return
+    for pair in args.pairs:
+        mic_path, ref_path = pair.split(":")
+        report(mic_path, load_wav(mic_path, MIC_RATE), load_wav(ref_path, REF_RATE), None, config)
+
+
+if __name__ == "__main__":
+    main()
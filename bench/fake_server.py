@@ -0,0 +1,302 @@
+"""
+本地替身服务端: 最小的明文 MQTT 3.1.1 broker 加 UDP 音频端点，用和真实服务端相同的
+hello/tts/goodbye 消息和 AES-CTR 包格式，只在 localhost 上运行，给 bench.loadtest 用.
+
+每个 MQTT 连接就是一台设备，不需要订阅：
+- hello: 分配会话、key 和 nonce (nonce 第 4-8 字节是会话号，用来把上行 UDP 包对应到会话)
+- 收到 talk_frames 个上行音频包后(用户说完)，等 think_ms 发 stt、tts start，
+  按帧长推送 tts_frames 个 opus 帧，再发 tts stop，goodbye_ms 后发 goodbye
+
+    python -m bench.fake_server --mqtt-port 1883
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import struct
+import time
+import uuid
+
+import opuslib
+
+from device.udp_crypto import HEADER_SIZE, PacketOpener, PacketSealer
+
+SAMPLE_RATE = 24000
+FRAME_DURATION = 60
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_DURATION // 1000
+
+CONNECT = 0x10
+PUBLISH = 0x30
+PUBACK = 0x40
+PINGREQ = 0xC0
+DISCONNECT = 0xE0
+
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def publish_packet(topic, payload):
+    topic = topic.encode("utf-8")
+    body = struct.pack("!H", len(topic)) + topic + payload
+    return bytes([PUBLISH]) + encode_length(len(body)) + body
+
+
+def tts_frames(count):
+    encoder = opuslib.Encoder(SAMPLE_RATE, 1, opuslib.APPLICATION_VOIP)
+    frames = []
+    for index in range(count):
+        start = index * FRAME_SAMPLES
+        pcm = struct.pack(f"<{FRAME_SAMPLES}h", *(
+            int(6000 * math.sin(2 * math.pi * 300 * (start + n) / SAMPLE_RATE)) for n in range(FRAME_SAMPLES)))
+        frames.append(encoder.encode(pcm, FRAME_SAMPLES))
+    return frames
+
+
+def mqtt_config(port, index, host="127.0.0.1"):
+    """给 Client.connect() 的 mqtt 配置，和 OTA 下发的格式一致."""
+    return {
+        "endpoint": f"{host}:{port}",
+        "client_id": f"loadtest-{index}",
+        "username": "loadtest",
+        "password": "loadtest",
+        "publish_topic": "device-server",
+        "tls": False,
+    }
+
+
+class FakeSession:
+    def __init__(self, device, number):
+        self.device = device
+        self.number = number
+        self.id = str(uuid.uuid4())
+        self.key = os.urandom(16).hex()
+        nonce = bytearray(os.urandom(16))
+        nonce[0] = 0x01
+        struct.pack_into("!I", nonce, 4, number)
+        self.nonce = bytes(nonce).hex()
+        self.opener = PacketOpener(self.key)
+        self.sealer = PacketSealer(self.key, self.nonce)
+        self.address = None
+        self.uplink_packets = 0
+        self.responding = False
+        self.aborted = False
+        self.closed = False
+
+
+class FakeDevice(asyncio.Protocol):
+    """一个 MQTT 连接."""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.buffer = bytearray()
+        self.session = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if self.session is not None:
+            self.server.close_session(self.session)
+
+    def data_received(self, data):
+        self.buffer += data
+        while True:
+            packet = self._next_packet()
+            if packet is None:
+                return
+            self._handle(*packet)
+
+    def _next_packet(self):
+        buffer = self.buffer
+        length = 0
+        multiplier = 1
+        offset = 1
+        while True:
+            if offset >= len(buffer):
+                return None
+            byte = buffer[offset]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            offset += 1
+            if not byte & 0x80:
+                break
+        if len(buffer) < offset + length:
+            return None
+        header = buffer[0]
+        body = bytes(buffer[offset:offset + length])
+        del buffer[:offset + length]
+        return header, body
+
+    def _handle(self, header, body):
+        kind = header & 0xF0
+        if kind == CONNECT:
+            self.transport.write(b"\x20\x02\x00\x00")
+        elif kind == PUBLISH:
+            topic_length, = struct.unpack_from("!H", body)
+            offset = 2 + topic_length
+            if (header >> 1) & 0x03:
+                # QoS 1，回 PUBACK；QoS 2 用不到
+                self.transport.write(bytes([PUBACK, 2]) + body[offset:offset + 2])
+                offset += 2
+            self.server.on_message(self, json.loads(body[offset:]))
+        elif kind == PINGREQ:
+            self.transport.write(b"\xd0\x00")
+        elif kind == DISCONNECT:
+            self.transport.close()
+
+    def send(self, message):
+        if not self.transport.is_closing():
+            self.transport.write(publish_packet("devices/p2p", json.dumps(message).encode("utf-8")))
+
+
+class FakeUdp(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.on_datagram(bytearray(data), addr)
+
+
+class FakeServer:
+    def __init__(self, talk_frames=30, think_ms=0, tts_count=20, goodbye_ms=200, host="127.0.0.1"):
+        self.talk_frames = talk_frames
+        self.think = think_ms / 1000
+        self.goodbye = goodbye_ms / 1000
+        self.host = host
+        self.frames = tts_frames(tts_count)
+        self.sessions = {}
+        self.udp = None
+        self.udp_port = None
+        self.mqtt_port = None
+        self._next_number = 1
+        self.uplink_packets = 0
+        self.downlink_packets = 0
+
+    async def start(self, mqtt_port=0, udp_port=0):
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: FakeDevice(self), self.host, mqtt_port)
+        self.mqtt_port = server.sockets[0].getsockname()[1]
+        self.udp, _ = await loop.create_datagram_endpoint(
+            lambda: FakeUdp(self), local_addr=(self.host, udp_port))
+        self.udp_port = self.udp.get_extra_info("sockname")[1]
+        return server
+
+    def on_message(self, device, message):
+        kind = message.get("type")
+        if kind == "hello":
+            if device.session is not None:
+                self.close_session(device.session)
+            session = FakeSession(device, self._next_number)
+            self._next_number += 1
+            self.sessions[session.number] = session
+            device.session = session
+            device.send({
+                "type": "hello",
+                "transport": "udp",
+                "session_id": session.id,
+                "audio_params": {"format": "opus", "sample_rate": SAMPLE_RATE,
+                                 "channels": 1, "frame_duration": FRAME_DURATION},
+                "udp": {"server": self.host, "port": self.udp_port, "encryption": "aes-128-ctr",
+                        "key": session.key, "nonce": session.nonce},
+            })
+        elif kind == "abort" and device.session is not None:
+            device.session.aborted = True
+        elif kind == "goodbye" and device.session is not None:
+            self.close_session(device.session)
+
+    def close_session(self, session):
+        session.closed = True
+        session.device.session = None
+        self.sessions.pop(session.number, None)
+
+    def on_datagram(self, data, addr):
+        if len(data) < HEADER_SIZE:
+            return
+        number, = struct.unpack_from("!I", data, 4)
+        session = self.sessions.get(number)
+        if session is None:
+            return
+        # update_into 的输出缓冲要多留一个分组
+        session.opener.open(memoryview(data + bytes(16)), len(data))
+        session.address = addr
+        session.uplink_packets += 1
+        self.uplink_packets += 1
+        if session.uplink_packets >= self.talk_frames and not session.responding:
+            session.responding = True
+            asyncio.get_running_loop().create_task(self._respond(session))
+
+    async def _respond(self, session):
+        device = session.device
+        await asyncio.sleep(self.think)
+        if session.closed:
+            return
+        device.send({"type": "stt", "text": "你好", "session_id": session.id})
+        device.send({"type": "tts", "state": "start", "session_id": session.id})
+        deadline = time.monotonic()
+        for sequence, frame in enumerate(self.frames, 1):
+            if session.closed:
+                return
+            if session.aborted:
+                # 被打断: 停止 tts，等设备说完下一句再回答
+                device.send({"type": "tts", "state": "stop", "session_id": session.id})
+                session.aborted = False
+                session.responding = False
+                session.uplink_packets = 0
+                return
+            self.udp.sendto(bytes(session.sealer.seal(frame, sequence)), session.address)
+            self.downlink_packets += 1
+            deadline += FRAME_DURATION / 1000
+            await asyncio.sleep(max(0, deadline - time.monotonic()))
+        device.send({"type": "tts", "state": "stop", "session_id": session.id})
+        await asyncio.sleep(self.goodbye)
+        if not session.closed:
+            device.send({"type": "goodbye", "session_id": session.id})
+            self.close_session(session)
+
+
+def serve(ready, stats, talk_frames, think_ms, tts_count, goodbye_ms):
+    """multiprocessing 入口: 把 (mqtt_port, udp_port) 放进 ready，结束时把包计数放进 stats."""
+    async def main():
+        server = FakeServer(talk_frames, think_ms, tts_count, goodbye_ms)
+        await server.start()
+        ready.put((server.mqtt_port, server.udp_port))
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        await stop.wait()
+        stats.put({"uplink_packets": server.uplink_packets,
+                   "downlink_packets": server.downlink_packets,
+                   "cpu_s": time.process_time()})
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in xiaozhi server")
+    parser.add_argument("--mqtt-port", type=int, default=1883)
+    parser.add_argument("--udp-port", type=int, default=0)
+    parser.add_argument("--talk-frames", type=int, default=30)
+    parser.add_argument("--think-ms", type=int, default=0)
+    parser.add_argument("--tts-frames", type=int, default=20)
+    args = parser.parse_args()
+
+    async def run():
+        server = FakeServer(args.talk_frames, args.think_ms, args.tts_frames)
+        await server.start(args.mqtt_port, args.udp_port)
+        print(f"mqtt 127.0.0.1:{server.mqtt_port} udp 127.0.0.1:{server.udp_port}")
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
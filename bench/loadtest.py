@@ -0,0 +1,255 @@
+"""
+本地压测: 在子进程里启动 bench.fake_server，M 个 Client 并发跑
+唤醒 → 聆听 → tts → goodbye 循环，全部走 localhost，可以放进 CI 抓回归.
+
+输出 hello 到 UDP 就绪、首包音频延迟(说完话到第一帧下行 PCM)的 p50/p99，
+每个会话的包率和客户端 CPU. 超过 --max-*-p99 阈值时以非零状态退出.
+--barge-in-ms 在第一帧下行音频之后打断播报再说一句，输出打断到下行静音的延迟.
+
+    python -m bench.loadtest --clients 20 --cycles 3
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import time
+
+from bench import fake_server
+from client import Client
+from config.load import read_config
+from device.audio_source import FileSource, frame_bytes, synthetic_speech
+from device.status import Status
+from fleet import audio_clock
+from logger import setup_logging
+from metrics import LatencyStats
+from protocol.event_loop import TransportLoop
+
+
+class LoadClient:
+    def __init__(self, index, config, transport, executor, pcm, stats):
+        self.index = index
+        self.source = FileSource(frame_bytes(config['audio']['opus']), pcm=pcm, offset=random.randrange(len(pcm)))
+        self.stats = stats
+        self.talk_until = 0.0
+        self.awaiting_audio = False
+        self.audio_started = None
+        self.interrupted_at = None
+        self.stale_audio_at = None
+        self.transport = transport
+        self.done = None
+        self.hello_timeout = config['session']['hello_timeout']
+        self.client = Client(config, transport, output=self.on_audio, restart=self.on_restart,
+                             executor=executor)
+        self.session = self.client.session
+
+    def on_audio(self, pcm):
+        # 抖动缓冲出帧时在事件循环里调用
+        now = time.monotonic()
+        if self.interrupted_at is not None and self.session.state != Status.Speaking:
+            # 打断之后还输出的下行音频
+            self.stale_audio_at = now
+        if self.awaiting_audio:
+            self.awaiting_audio = False
+            self.stats['first_audio'].record(now - self.talk_until)
+            self.transport.call_soon(self.audio_started.set)
+
+    def on_restart(self):
+        # goodbye 或 hello 超时后调用，可能不在事件循环线程里
+        if self.done is not None:
+            self.transport.call_soon(self.done.set)
+
+    async def run(self, cycles, talk_seconds, wake_executor, cycle_timeout, barge_in=0.0):
+        loop = asyncio.get_running_loop()
+        for _ in range(cycles):
+            self.done = asyncio.Event()
+            self.audio_started = asyncio.Event()
+            begin = time.monotonic()
+            self.talk_until = begin + talk_seconds
+            self.awaiting_audio = True
+            # wake() 不等 hello，在线程池里等通道就绪
+            if not self.client.wake() or not await loop.run_in_executor(
+                    wake_executor, self.session.ready.wait, self.hello_timeout):
+                self.stats['failures'] += 1
+                continue
+            self.stats['hello_to_ready'].record(time.monotonic() - begin)
+            interrupt = None
+            if barge_in:
+                interrupt = loop.create_task(self.interrupt(barge_in, talk_seconds))
+            try:
+                await asyncio.wait_for(self.done.wait(), cycle_timeout)
+                self.stats['cycles'] += 1
+            except asyncio.TimeoutError:
+                self.stats['failures'] += 1
+                self.client.session.terminate()
+            if interrupt is not None:
+                interrupt.cancel()
+
+    async def interrupt(self, delay, talk_seconds):
+        """
+        第一帧下行音频 delay 秒后打断播报，接着再说一句. 打断到下行静音的延迟取打断之后
+        最后一次输出下行音频的时间，没有输出就取 wake() 返回的时间.
+        """
+        await self.audio_started.wait()
+        await asyncio.sleep(delay)
+        self.stale_audio_at = None
+        self.interrupted_at = time.monotonic()
+        self.talk_until = self.interrupted_at + talk_seconds
+        try:
+            if not self.client.wake():
+                # tts 已经放完了
+                return
+            returned = time.monotonic()
+            await asyncio.sleep(0.2)
+            silent_at = max(returned, self.stale_audio_at or returned)
+            self.stats['interrupt_to_silence'].record(silent_at - self.interrupted_at)
+        finally:
+            self.interrupted_at = None
+
+
+async def run_clients(clients, args, wake_executor, frame_duration, silence):
+    loop = asyncio.get_running_loop()
+    clock = loop.create_task(audio_clock(clients, frame_duration, silence))
+
+    async def staggered(load_client):
+        await asyncio.sleep(random.uniform(0, args.stagger))
+        await load_client.run(args.cycles, args.talk_seconds, wake_executor, args.cycle_timeout,
+                              args.barge_in_ms / 1000)
+
+    await asyncio.gather(*(staggered(load_client) for load_client in clients))
+    clock.cancel()
+
+
+def print_latency(label, stats):
+    summary = stats.summary()
+    if not summary['count']:
+        print(f"{label:<20} n/a")
+        return None
+    print(f"{label:<20} p50 {summary['p50_ms']:7.1f} ms  p99 {summary['p99_ms']:7.1f} ms  "
+          f"max {summary['max_ms']:7.1f} ms  (n={summary['count']})")
+    return summary['p99_ms']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Localhost load test against a stand-in server")
+    parser.add_argument("--config_path", type=str, default="./config/default.yml")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--talk-seconds", type=float, default=2.0)
+    parser.add_argument("--think-ms", type=int, default=0, help="服务端说完话到开始 tts 的延迟")
+    parser.add_argument("--tts-frames", type=int, default=20)
+    parser.add_argument("--stagger", type=float, default=1.0, help="各客户端开始时间的随机错开范围(秒)")
+    parser.add_argument("--codec-workers", type=int, default=4)
+    parser.add_argument("--cycle-timeout", type=float, default=30.0)
+    parser.add_argument("--prewarm", action="store_true", help="打开会话预热(hello 延迟会接近 0)")
+    parser.add_argument("--barge-in-ms", type=int, default=0, help="第一帧下行音频之后多久打断播报，0 不打断")
+    parser.add_argument("--max-hello-p99", type=float, default=0, help="hello p99 阈值(ms)，0 不检查")
+    parser.add_argument("--max-first-audio-p99", type=float, default=0, help="首包 p99 阈值(ms)，0 不检查")
+    args = parser.parse_args()
+
+    config = read_config(args.config_path)
+    config['session']['prewarm'] = args.prewarm
+    if args.barge_in_ms:
+        config['session']['barge_in']['enabled'] = True
+    config['logger']['level'] = 'WARNING'
+    setup_logging(config['logger'])
+    opus = config['audio']['opus']
+    frame_duration = opus['frame_duration']
+    talk_frames = int(args.talk_seconds * 1000 / frame_duration)
+
+    ready = multiprocessing.Queue()
+    server_stats = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=fake_server.serve,
+        args=(ready, server_stats, talk_frames, args.think_ms, args.tts_frames, 200),
+        daemon=True)
+    server.start()
+    mqtt_port, _ = ready.get(timeout=30)
+
+    stats = {
+        'hello_to_ready': LatencyStats("hello_to_ready"),
+        'first_audio': LatencyStats("first_audio"),
+        'interrupt_to_silence': LatencyStats("interrupt_to_silence"),
+        'cycles': 0,
+        'failures': 0,
+    }
+    transport = TransportLoop()
+    transport.start()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.codec_workers, thread_name_prefix="codec")
+    wake_executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.clients, thread_name_prefix="wake")
+    pcm = synthetic_speech()
+    silence = bytes(frame_bytes(opus))
+    clients = [LoadClient(index, config, transport, executor, pcm, stats) for index in range(args.clients)]
+
+    async def connect_all():
+        await asyncio.gather(*(load_client.client.connect(fake_server.mqtt_config(mqtt_port, load_client.index))
+                               for load_client in clients))
+
+    transport.run(connect_all())
+    for load_client in clients:
+        load_client.session.uplink_pipeline.start()
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    transport.run(run_clients(clients, args, wake_executor, frame_duration, silence))
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    publish = LatencyStats("mqtt_publish", window=100000)
+    handlers = {}
+    transitions = {}
+    max_queue = 0
+    for load_client in clients:
+        publisher = load_client.client.mqtt.publisher
+        for sample in publisher.latency.samples:
+            publish.record(sample)
+        max_queue = max(max_queue, publisher.max_depth)
+        for type, latency in load_client.client.dispatcher.latency.items():
+            merged = handlers.setdefault(type, LatencyStats(type, window=100000))
+            for sample in latency.samples:
+                merged.record(sample)
+        for name, latency in load_client.client.machine.transition_latency.items():
+            merged = transitions.setdefault(name, LatencyStats(name, window=100000))
+            for sample in latency.samples:
+                merged.record(sample)
+
+    for load_client in clients:
+        load_client.session.uplink_pipeline.stop()
+        load_client.client.stop()
+    transport.stop()
+    executor.shutdown()
+    wake_executor.shutdown()
+    os.kill(server.pid, signal.SIGTERM)
+    totals = server_stats.get(timeout=30)
+    server.join()
+
+    packets = totals['uplink_packets'] + totals['downlink_packets']
+    print(f"clients {args.clients}, cycles {stats['cycles']}/{args.clients * args.cycles}, "
+          f"failures {stats['failures']}, {wall:.1f} s")
+    hello_p99 = print_latency("hello to ready", stats['hello_to_ready'])
+    first_audio_p99 = print_latency("first audio", stats['first_audio'])
+    if args.barge_in_ms:
+        print_latency("interrupt to silence", stats['interrupt_to_silence'])
+    print_latency("mqtt publish", publish)
+    print(f"publish queue        max depth {max_queue}")
+    for type, latency in sorted(handlers.items()):
+        print_latency(f"handler {type}", latency)
+    for name, latency in sorted(transitions.items()):
+        print_latency(name, latency)
+    print(f"packets              {packets / wall / args.clients:.1f} /s per session "
+          f"(up {totals['uplink_packets']}, down {totals['downlink_packets']})")
+    print(f"client cpu           {cpu / wall / args.clients * 100:.2f} % of a core per session "
+          f"(server {totals['cpu_s']:.1f} s)")
+
+    failed = stats['failures'] > 0
+    if args.max_hello_p99 and (hello_p99 is None or hello_p99 > args.max_hello_p99):
+        failed = True
+    if args.max_first_audio_p99 and (first_audio_p99 is None or first_audio_p99 > args.max_first_audio_p99):
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
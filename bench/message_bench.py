@@ -0,0 +1,135 @@
+"""
+MQTT 消息编码微基准: 旧的每次构造 dict + json.dumps vs protocol.messages 预编译模板.
+
+输出每种消息的 msgs/s 和单条消息编码时分配的字节数(tracemalloc 峰值).
+
+    python -m bench.message_bench --messages 50000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import uuid
+
+from device.codec import hello_audio_params
+from iot.thing_manager import ThingManager
+from iot.things import Lamp, Speaker
+from protocol import messages
+
+AUDIO_PARAMS = hello_audio_params({"sample_rate": 16000, "channels": 1, "frame_duration": 60})
+
+
+def legacy_iot_descriptors(session_id):
+    return {
+        "session_id": session_id,
+        "type": "iot",
+        "descriptors": [
+            {
+                "name": "Speaker",
+                "description": "当前 AI 机器人的扬声器",
+                "properties": {"volume": {"description": "当前音量值", "type": "number"}},
+                "methods": {
+                    "SetVolume": {
+                        "description": "设置音量",
+                        "parameters": {"volume": {"description": "0到100之间的整数", "type": "number"}}
+                    }
+                }
+            },
+            {
+                "name": "Lamp",
+                "description": "一个测试用的灯",
+                "properties": {"power": {"description": "灯是否打开", "type": "boolean"}},
+                "methods": {
+                    "TurnOn": {"description": "打开灯", "parameters": {}},
+                    "TurnOff": {"description": "关闭灯", "parameters": {}}
+                }
+            }
+        ]
+    }
+
+
+def legacy_iot_states(session_id):
+    return {
+        "session_id": session_id,
+        "type": "iot",
+        "states": [
+            {"name": "Speaker", "state": {"volume": 0}},
+            {"name": "Lamp", "state": {"power": False}}
+        ]
+    }
+
+
+def legacy_encode(message):
+    # paho 会把 str payload 编码成 UTF-8
+    return json.dumps(message).encode("utf-8")
+
+
+def cases(session_id):
+    hello = messages.HELLO.bind(audio_params=AUDIO_PARAMS)
+    things = ThingManager(transport=None)
+    things.add(Speaker())
+    things.add(Lamp())
+    descriptors = things.descriptors
+
+    def full_states():
+        return [{"name": thing.name, "state": thing.state()} for thing in things.things.values()]
+
+    return [
+        ("hello",
+         lambda: legacy_encode({"type": "hello", "version": 3, "transport": "udp", "audio_params": AUDIO_PARAMS}),
+         lambda: hello.render()),
+        ("wake_word",
+         lambda: legacy_encode({"session_id": session_id, "type": "listen", "state": "detect", "text": "小智"}),
+         lambda: messages.WAKE_WORD_DETECTED.render(session_id=session_id, wake_word="小智")),
+        ("goodbye",
+         lambda: legacy_encode({"session_id": session_id, "type": "goodbye"}),
+         lambda: messages.GOODBYE.render(session_id=session_id)),
+        ("iot_states",
+         lambda: legacy_encode(legacy_iot_states(session_id)),
+         lambda: messages.IOT_STATES.render(session_id=session_id, states=full_states())),
+        ("iot_descriptors",
+         lambda: legacy_encode(legacy_iot_descriptors(session_id)),
+         lambda: descriptors.render(session_id=session_id)),
+    ]
+
+
+def rate(count, build):
+    start = time.perf_counter()
+    for _ in range(count):
+        build()
+    return count / (time.perf_counter() - start)
+
+
+def allocated(build, samples=200):
+    """单条消息编码过程中的内存分配峰值，取平均."""
+    build()
+    tracemalloc.start()
+    total = 0
+    for _ in range(samples):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        build()
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT message encoding benchmark")
+    parser.add_argument("--messages", type=int, default=50000)
+    args = parser.parse_args()
+
+    session_id = str(uuid.uuid4())
+    print(f"{'message':<16} {'legacy msgs/s':>14} {'template msgs/s':>16} {'speedup':>8} "
+          f"{'legacy B':>9} {'template B':>11} {'wire B':>12}")
+    for name, legacy, template in cases(session_id):
+        assert json.loads(legacy()) == json.loads(template())
+        before = rate(args.messages, legacy)
+        after = rate(args.messages, template)
+        print(f"{name:<16} {before:>14,.0f} {after:>16,.0f} {after / before:>7.1f}x "
+              f"{allocated(legacy):>9,.0f} {allocated(template):>11,.0f} "
+              f"{len(legacy()):>5} -> {len(template()):<5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+上行 opus 编码设置对比: 不同 complexity / bitrate / 帧长 / DTX 下每秒音频的编码 CPU 时间、
+包率和码率. 默认用合成的一段语音+静音信号，也可以传入 16kHz 单声道 16bit WAV.
+
+    python -m bench.opus_bench --seconds 60
+    python -m bench.opus_bench recordings/xiaolai_01.wav
+"""
+import argparse
+import time
+
+from device.audio_source import load_wav, synthetic_speech
+from device.codec import create_encoder, DTX_FRAME_BYTES
+
+SAMPLE_RATE = 16000
+
+SETTINGS = [
+    # (frame_duration, complexity, bitrate, dtx)
+    (60, 0, 'auto', False),
+    (60, 3, 'auto', False),
+    (60, 5, 'auto', False),
+    (60, 8, 'auto', False),
+    (60, 10, 'auto', False),
+    (60, 5, 16000, False),
+    (60, 5, 32000, False),
+    (60, 5, 'auto', True),
+    (40, 5, 'auto', False),
+    (20, 5, 'auto', False),
+]
+
+
+def run(pcm, frame_duration, complexity, bitrate, dtx):
+    encoder = create_encoder({
+        "sample_rate": SAMPLE_RATE, "channels": 1, "frame_duration": frame_duration,
+        "complexity": complexity, "bitrate": bitrate, "dtx": dtx,
+    })
+    frame_samples = SAMPLE_RATE * frame_duration // 1000
+    frame_bytes = frame_samples * 2
+    frames = [pcm[offset:offset + frame_bytes]
+              for offset in range(0, len(pcm) - frame_bytes + 1, frame_bytes)]
+    cpu_start = time.process_time()
+    sizes = [len(encoder.encode(frame, frame_samples)) for frame in frames]
+    cpu = time.process_time() - cpu_start
+    seconds = len(frames) * frame_duration / 1000
+    sent = [size for size in sizes if size > DTX_FRAME_BYTES]
+    return {
+        "cpu_ms_per_s": cpu * 1000 / seconds,
+        "packets_per_s": len(sent) / seconds,
+        "kbps": sum(sent) * 8 / seconds / 1000,
+        "mean_bytes": sum(sent) / len(sent) if sent else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Opus encoder settings benchmark")
+    parser.add_argument("wavs", nargs="*")
+    parser.add_argument("--seconds", type=int, default=30, help="合成信号长度")
+    args = parser.parse_args()
+
+    if args.wavs:
+        pcm = b"".join(load_wav(path) for path in args.wavs)
+    else:
+        pcm = synthetic_speech(args.seconds)
+    print(f"audio {len(pcm) / SAMPLE_RATE / 2:.1f} s")
+    print(f"{'frame':>6} {'cx':>3} {'bitrate':>8} {'dtx':>4} "
+          f"{'cpu ms/s':>9} {'pkt/s':>6} {'kbps':>6} {'bytes':>6}")
+    for frame_duration, complexity, bitrate, dtx in SETTINGS:
+        result = run(pcm, frame_duration, complexity, bitrate, dtx)
+        print(f"{frame_duration:>4}ms {complexity:>3} {bitrate:>8} {'on' if dtx else 'off':>4} "
+              f"{result['cpu_ms_per_s']:>9.2f} {result['packets_per_s']:>6.1f} "
+              f"{result['kbps']:>6.1f} {result['mean_bytes']:>6.0f}")
+
+
+if __name__ == "__main__":
+    main()
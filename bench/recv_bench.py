@@ -0,0 +1,157 @@
+"""
+下行接收微基准: 旧的接收线程 recvfrom + 逐包构造 cipher 实现 vs 事件循环里 recv_into 缓冲区环的 UdpChannel.
+
+用 AF_UNIX 数据报 socketpair 代替真实网络，只比较接收路径本身的开销.
+输出包率和单个包从 socket 读出到交给回调在 Python 堆上分配的字节数(tracemalloc 峰值).
+
+    python -m bench.recv_bench --packets 50000 --payload 120
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+import tracemalloc
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+
+from device.udp_channel import UdpChannel
+from device.udp_crypto import PacketSealer
+from protocol.event_loop import TransportLoop
+
+BATCH = 32
+
+
+class LegacyReceiver:
+    def __init__(self, sock, key, callback):
+        self.sock = sock
+        self.key = key
+        self.callback = callback
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            data, address = self.sock.recvfrom(1500)
+            self.handle(data)
+
+    def handle(self, data):
+        if len(data) >= 16:
+            cipher = Cipher(algorithms.AES(bytes.fromhex(self.key)), modes.CTR(bytes(data[:16])), backend=default_backend())
+            encryptor = cipher.decryptor()
+            ciphertext_data = encryptor.update(data[16:]) + encryptor.finalize()
+            self.callback(int.from_bytes(data[12:16], "big"), ciphertext_data)
+
+
+class ChannelReceiver:
+    def __init__(self, sock, key, callback):
+        self.sock = sock
+        self.key = key
+        self.callback = callback
+        self.transport = TransportLoop()
+        self.channel = None
+
+    @property
+    def stats(self):
+        return self.channel.stats
+
+    def start(self):
+        self.transport.start()
+        self.transport.run(self._open())
+
+    async def _open(self):
+        self.channel = UdpChannel(self.transport.loop, self.sock, self.key, self.callback)
+        self.channel.start()
+
+    def stop(self):
+        self.channel.close()
+        self.transport.stop()
+
+
+def allocated(make_receive, datagrams, samples=200):
+    """
+    单个包从 socket 读出到交给回调过程中的内存分配峰值，取平均.
+    make_receive(sock) 返回从 sock 收一个包并处理的函数，在当前线程里同步收发.
+    """
+    sender, receiver_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    receive = make_receive(receiver_socket)
+    sender.send(datagrams[0])
+    receive()
+    tracemalloc.start()
+    total = 0
+    for datagram in datagrams[:samples]:
+        sender.send(datagram)
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        receive()
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    sender.close()
+    receiver_socket.close()
+    return total / samples
+
+
+def run(label, receiver_class, packets, datagrams, key, expected):
+    sender, receiver_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    drained = threading.Semaphore(0)
+
+    def on_packet(sequence, payload):
+        if sequence == 1:
+            assert bytes(payload) == expected
+        drained.release()
+
+    receiver = receiver_class(receiver_socket, key, on_packet)
+    receiver.start()
+    start = time.perf_counter()
+    for offset in range(0, packets, BATCH):
+        for datagram in datagrams[offset:offset + BATCH]:
+            sender.send(datagram)
+        for _ in datagrams[offset:offset + BATCH]:
+            drained.acquire()
+    elapsed = time.perf_counter() - start
+    # 旧实现的接收线程是 daemon，停在 recvfrom 里随进程退出
+    receiver.stop()
+    sender.close()
+    print(f"{label:<8} {packets / elapsed:>12,.0f} packets/s  {elapsed / packets * 1e6:>8.2f} us/packet")
+    return receiver, packets / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UdpChannel benchmark")
+    parser.add_argument("--packets", type=int, default=50000)
+    parser.add_argument("--payload", type=int, default=120, help="opus 帧字节数")
+    args = parser.parse_args()
+
+    key = os.urandom(16).hex()
+    sealer = PacketSealer(key, os.urandom(16).hex())
+    payload = os.urandom(args.payload)
+    datagrams = [bytes(sealer.seal(payload, sequence)) for sequence in range(1, args.packets + 1)]
+
+    _, before = run("legacy", LegacyReceiver, args.packets, datagrams, key, payload)
+    receiver, after = run("asyncio", ChannelReceiver, args.packets, datagrams, key, payload)
+    print(f"speedup  {after / before:.2f}x")
+
+    def discard(sequence, payload):
+        pass
+
+    def legacy_receive(sock):
+        legacy = LegacyReceiver(sock, key, discard)
+        return lambda: legacy.handle(sock.recvfrom(1500)[0])
+
+    def channel_receive(sock):
+        return UdpChannel(None, sock, key, discard)._on_readable
+
+    print(f"allocated per packet: legacy {allocated(legacy_receive, datagrams):,.0f} B, "
+          f"asyncio {allocated(channel_receive, datagrams):,.0f} B")
+    print(f"channel totals: {receiver.stats.totals}")
+
+
+if __name__ == "__main__":
+    main()
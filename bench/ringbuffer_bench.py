@@ -0,0 +1,57 @@
+"""
+唤醒词检测缓冲微基准: 旧的 deque 逐字节 RingBuffer vs bytearray RingBuffer.
+
+按 HotwordDetector 的用法模拟: 每个 60ms 回调写入 ring_buffer，检测循环取走，
+输出每秒 16kHz 音频消耗的 CPU 时间.
+
+    python -m bench.ringbuffer_bench --seconds 600
+"""
+import argparse
+import collections
+import os
+import time
+
+from snowboy.ringbuffer import RingBuffer
+
+SAMPLE_RATE = 16000
+CHUNK_BYTES = SAMPLE_RATE * 2 * 60 // 1000
+
+
+class DequeRingBuffer(object):
+    def __init__(self, size=4096):
+        self._buf = collections.deque(maxlen=size)
+
+    def extend(self, data):
+        self._buf.extend(data)
+
+    def get(self):
+        tmp = bytes(bytearray(self._buf))
+        self._buf.clear()
+        return tmp
+
+
+def run(label, buffer_class, seconds):
+    chunk = os.urandom(CHUNK_BYTES)
+    ring_buffer = buffer_class(SAMPLE_RATE * 2)
+    chunks = seconds * 1000 // 60
+    start = time.process_time()
+    for _ in range(chunks):
+        ring_buffer.extend(chunk)
+        ring_buffer.get()
+    cpu = (time.process_time() - start) / (chunks * 60 / 1000)
+    print(f"{label:<10} {cpu * 1e3:>8.3f} ms CPU per second of audio")
+    return cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RingBuffer benchmark")
+    parser.add_argument("--seconds", type=int, default=600, help="模拟的音频时长")
+    args = parser.parse_args()
+
+    before = run("deque", DequeRingBuffer, args.seconds)
+    after = run("bytearray", RingBuffer, args.seconds)
+    print(f"speedup    {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
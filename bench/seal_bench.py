@@ -0,0 +1,63 @@
+"""
+上行加密微基准: 旧的逐帧解析 key/nonce 实现 vs PacketSealer.
+
+    python -m bench.seal_bench --packets 50000 --payload 120
+"""
+import argparse
+import os
+import struct
+import time
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+
+from device.udp_crypto import PacketSealer
+
+
+def seal_legacy(key, nonce, opus_frame, sequence):
+    aes_key = bytes.fromhex(key)
+    aes_nonce = bytearray.fromhex(nonce)
+    struct.pack_into("!H", aes_nonce, 2, len(opus_frame))
+    struct.pack_into("!I", aes_nonce, 12, sequence)
+
+    encrypted_payload = bytearray(aes_nonce)
+    encrypted_payload.extend(opus_frame)
+
+    cipher = Cipher(algorithms.AES(aes_key), modes.CTR(bytes(aes_nonce[:16])), backend=default_backend())
+    encryptor = cipher.encryptor()
+    ciphertext_data = encryptor.update(opus_frame) + encryptor.finalize()
+
+    encrypted_payload[len(aes_nonce):] = ciphertext_data
+    return encrypted_payload
+
+
+def run(label, packets, seal):
+    start = time.perf_counter()
+    for sequence in range(1, packets + 1):
+        seal(sequence)
+    elapsed = time.perf_counter() - start
+    rate = packets / elapsed
+    print(f"{label:<8} {rate:>12,.0f} packets/s  {elapsed / packets * 1e6:>8.2f} us/packet")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PacketSealer benchmark")
+    parser.add_argument("--packets", type=int, default=50000)
+    parser.add_argument("--payload", type=int, default=120, help="opus 帧字节数")
+    args = parser.parse_args()
+
+    key = os.urandom(16).hex()
+    nonce = os.urandom(16).hex()
+    payload = os.urandom(args.payload)
+
+    sealer = PacketSealer(key, nonce)
+    assert bytes(sealer.seal(payload, 7)) == bytes(seal_legacy(key, nonce, payload, 7))
+
+    before = run("legacy", args.packets, lambda seq: seal_legacy(key, nonce, payload, seq))
+    after = run("sealer", args.packets, lambda seq: sealer.seal(payload, seq))
+    print(f"speedup  {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
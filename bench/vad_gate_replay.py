@@ -0,0 +1,67 @@
+"""
+VAD 门控回放: 同一批 16kHz 单声道 WAV 分别在开/关 VAD 门控时送入 HotwordDetector，
+比较门控占空比(送进 RunDetection 的音频比例)和漏唤醒率.
+
+    python -m bench.vad_gate_replay recordings/*.wav
+"""
+import argparse
+import wave
+
+from device.vad import EnergyVad
+from snowboy import snowboydecoder
+from snowboy.snowboydecoder import DETECT_DING, DETECT_DONG
+
+CHUNK_MS = 60
+MODEL = "./snowboy/resources/xiaolai.pmdl"
+
+
+def read_chunks(path):
+    with wave.open(path, "rb") as wav:
+        if wav.getframerate() != 16000 or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: 需要 16kHz 单声道 16bit WAV")
+        frames = wav.getframerate() * CHUNK_MS // 1000
+        while True:
+            chunk = wav.readframes(frames)
+            if not chunk:
+                return
+            yield chunk
+
+
+def count_detections(detector, path):
+    detector.detector.Reset()
+    return sum(1 for chunk in read_chunks(path) if detector.detect_chunk(chunk) > 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VAD gate replay")
+    parser.add_argument("wavs", nargs="*", default=[DETECT_DING, DETECT_DONG])
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--sensitivity", type=float, default=0.6)
+    parser.add_argument("--energy-threshold", type=int, default=300)
+    parser.add_argument("--lookback-ms", type=int, default=300)
+    args = parser.parse_args()
+
+    ungated = snowboydecoder.HotwordDetector(args.model, sensitivity=args.sensitivity)
+    gated = snowboydecoder.HotwordDetector(
+        args.model, sensitivity=args.sensitivity,
+        vad=EnergyVad(energy_threshold=args.energy_threshold),
+        vad_lookback_ms=args.lookback_ms)
+
+    expected = 0
+    missed = 0
+    for path in args.wavs:
+        reference = count_detections(ungated, path)
+        hits = count_detections(gated, path)
+        expected += reference
+        missed += max(0, reference - hits)
+        print(f"{path}: ungated={reference} gated={hits}")
+
+    print(f"gate duty cycle  {gated.gate_duty_cycle:.1%}")
+    if expected:
+        print(f"missed wakes     {missed}/{expected} ({missed / expected:.1%})")
+    else:
+        print("missed wakes     n/a (no detections without the gate)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+唤醒词离线回放基准.
+
+把 WAV (16kHz 单声道 16bit) 或同格式的裸 PCM (.pcm/.raw) 按标注清单送入
+HotwordDetector.replay()，走和麦克风相同的环形缓冲、VAD 门控、RunDetection 和状态机，
+不需要音频设备，按最快速度运行. 输出实时率、每小时音频的 CPU 时间、检测延迟
+以及相对标注的命中/漏检/误唤醒.
+
+清单为 JSON 列表，keywords 是每次唤醒词结束时刻(秒):
+
+    [{"file": "recordings/xiaolai_01.wav", "keywords": [1.35, 6.8]},
+     {"file": "snowboy/resources/ding.wav", "keywords": []}]
+
+    python -m bench.wakeword_replay --manifest bench/wakeword_manifest.json --repeat 50
+"""
+import argparse
+import json
+import statistics
+import time
+import wave
+
+from device.vad import EnergyVad
+from snowboy import snowboydecoder
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+# 检测时刻相对标注结束时刻的容许范围(秒)
+EARLY_TOLERANCE = 0.5
+LATE_TOLERANCE = 1.5
+
+
+def load_pcm(path):
+    if path.endswith((".pcm", ".raw")):
+        with open(path, "rb") as f:
+            return f.read()
+    with wave.open(path, "rb") as wav:
+        if wav.getframerate() != SAMPLE_RATE or wav.getnchannels() != 1 or wav.getsampwidth() != SAMPLE_WIDTH:
+            raise ValueError(f"{path}: 需要 16kHz 单声道 16bit WAV")
+        return wav.readframes(wav.getnframes())
+
+
+def iter_chunks(pcm, chunk_bytes):
+    for offset in range(0, len(pcm), chunk_bytes):
+        yield pcm[offset:offset + chunk_bytes]
+
+
+def score(detections, keywords):
+    """按时间窗口把检测和标注一一匹配，返回 (命中延迟列表, 漏检数, 误唤醒数)."""
+    unmatched = sorted(keywords)
+    latencies = []
+    false_alarms = 0
+    for detected in sorted(detections):
+        match = next((k for k in unmatched
+                      if k - EARLY_TOLERANCE <= detected <= k + LATE_TOLERANCE), None)
+        if match is None:
+            false_alarms += 1
+        else:
+            unmatched.remove(match)
+            latencies.append(detected - match)
+    return latencies, len(unmatched), false_alarms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline wake word replay benchmark")
+    parser.add_argument("--manifest", default="bench/wakeword_manifest.json")
+    parser.add_argument("--model", default="./snowboy/resources/xiaolai.pmdl")
+    parser.add_argument("--sensitivity", type=float, default=0.6)
+    parser.add_argument("--chunk-ms", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=1, help="每个文件重复回放的次数")
+    parser.add_argument("--vad", action="store_true", help="启用 VAD 门控")
+    args = parser.parse_args()
+
+    with open(args.manifest, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    detector = snowboydecoder.HotwordDetector(
+        args.model, sensitivity=args.sensitivity,
+        vad=EnergyVad() if args.vad else None)
+    chunk_bytes = detector.chunk_size(args.chunk_ms)
+    bytes_per_second = SAMPLE_RATE * SAMPLE_WIDTH
+
+    detections = []
+
+    def detected_callback():
+        detections.append(detector.bytes_to_seconds(detector.last_detection_position))
+        # 和 goodbye 之后一样重新进入 PASSIVE，继续检测下一次唤醒
+        detector.restart()
+
+    audio_seconds = 0.0
+    hit_latencies = []
+    misses = 0
+    false_alarms = 0
+    wall_time = 0.0
+    cpu_time = 0.0
+    for entry in manifest:
+        pcm = load_pcm(entry["file"])
+        pcm += bytes(-len(pcm) % chunk_bytes)
+        duration = len(pcm) / bytes_per_second
+        file_start = audio_seconds
+        keywords = [file_start + r * duration + k
+                    for r in range(args.repeat) for k in entry.get("keywords", [])]
+        detections.clear()
+        detector.detector.Reset()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        for _ in range(args.repeat):
+            detector.replay(iter_chunks(pcm, chunk_bytes), detected_callback, chunk_ms=args.chunk_ms)
+        wall_time += time.perf_counter() - wall_start
+        cpu_time += time.process_time() - cpu_start
+        audio_seconds += duration * args.repeat
+
+        latencies, missed, alarms = score(detections, keywords)
+        hit_latencies += latencies
+        misses += missed
+        false_alarms += alarms
+        print(f"{entry['file']}: keywords={len(keywords)} hits={len(latencies)} "
+              f"misses={missed} false_alarms={alarms}")
+
+    hours = audio_seconds / 3600
+    print(f"audio            {audio_seconds:.1f} s")
+    print(f"real-time factor {wall_time / audio_seconds:.4f}")
+    print(f"cpu per hour     {cpu_time / hours:.1f} s")
+    print(f"hits             {len(hit_latencies)}  misses {misses}  "
+          f"false alarms {false_alarms} ({false_alarms / hours:.2f}/h)")
+    if hit_latencies:
+        print(f"detection delay  mean {statistics.mean(hit_latencies) * 1000:.0f} ms "
+              f"after keyword end, max {max(hit_latencies) * 1000:.0f} ms")
+    if detector.detection_latencies:
+        print(f"processing delay mean {statistics.mean(detector.detection_latencies) * 1000:.2f} ms")
+    if args.vad:
+        print(f"gate duty cycle  {detector.gate_duty_cycle:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import logging
+import threading
+import time
+
+from device.codec import hello_audio_params
+from device.session import Session
+from device.state_machine import StateMachine
+from device.status import Status
+from iot.thing_manager import ThingManager
+from iot.things import Lamp, Speaker
+from ota import OTA
+from protocol.dispatcher import Dispatcher
+from protocol.mqtt_protocol import MqttProtocol
+
+logger = logging.getLogger(__name__)
+
+
+class Client:
+    """
+    一台小智设备的信令部分：OTA、MQTT 消息处理和会话生命周期.
+
+    音频的来源和去向由调用方决定：app.py 接麦克风、唤醒词和扬声器，fleet.py 接文件或合成音频.
+    output 接收下行 PCM，flush_output(trigger) 清空播放缓冲，restart 在会话结束后重新开始检测唤醒词，
+    rearm 在开始播报时重新打开唤醒词检测，用来打断播报.
+    IoT 设备注册在 things 上，调用方可以在 start() 之前 add 更多设备.
+    """
+
+    def __init__(self, config: dict, transport, output, flush_output=None, restart=None,
+                 rearm=None, fingerprint=None, executor=None):
+        self.config = config
+        self.transport = transport
+        self.output = output
+        self.flush_output = flush_output
+        self.restart = restart
+        self.rearm = rearm
+        self.session = Session(config['audio'], executor=executor)
+        self.timers = transport.timers
+        self.fingerprint = fingerprint
+        self.mqtt = None
+        self.things = ThingManager(transport, config['iot']['coalesce_ms'] / 1000)
+        self.things.add(Speaker())
+        self.things.add(Lamp())
+        self.things.on_changed = self.publish_iot_states
+        # MQTT 消息在网络线程里解析，handler 在 dispatcher 的线程里按顺序执行
+        self.dispatcher = Dispatcher(config['mqtt']['dispatch'], executor=executor)
+        self.dispatcher.register('hello', self.hello_handler)
+        self.dispatcher.register('goodbye', self.goodbye_handler)
+        self.dispatcher.register('tts', self.tts_start_handler, state='start')
+        self.dispatcher.register('tts', self.tts_stop_handler, state='stop')
+        self.dispatcher.register('tts', self.tts_sentence_handler, state='sentence_start')
+        self.dispatcher.register('stt', self.stt_handler)
+        self.dispatcher.register('iot', self.iot_handler)
+        self.dispatcher.default = self.default_handler
+        # 状态超时和 hello 截止时间都在时间轮上，回调转到 handler 线程里执行
+        self.machine = StateMachine(self.session, self.timers, config['session'])
+        self.machine.on_timeout = lambda state: self.dispatcher.post(self.on_state_timeout, state)
+        self._hello_timer = None
+        self._wake_pending = False
+        self._wake_lock = threading.Lock()
+        self.interrupts = 0
+
+    async def start(self):
+        """激活并连接 MQTT，在事件循环里调用."""
+        ota = OTA(self.config['ota'], self.fingerprint)
+        server_config = await ota.init_server_config()
+        await self.connect(server_config['mqtt'])
+
+    async def connect(self, mqtt: dict):
+        """用 OTA 下发的 mqtt 配置连接，本地压测时直接传入."""
+        self.mqtt = MqttProtocol(mqtt, self.transport, self.config['mqtt'])
+        self.mqtt.on_message(self.dispatcher.on_message)
+        # 和消息 handler 在同一个线程里执行，避免同时修改会话
+        self.mqtt.on_reconnect = lambda: self.dispatcher.post(self.on_reconnect)
+        self.dispatcher.start()
+        await self.mqtt.start()
+        self.session.set_state(state=Status.Idle)
+        self.prewarm()
+
+    def stop(self):
+        self.session.terminate()
+        if self.mqtt is not None:
+            self.mqtt.disconnect()
+        self.dispatcher.stop()
+
+    def flush_downlink(self, trigger=None):
+        self.session.flush_downlink()
+        if self.flush_output is not None:
+            self.flush_output(trigger)
+
+    def send_hello(self):
+        session = self.session
+        if not session.hello_pending and not session.ready.is_set():
+            session.hello_pending = True
+            self._hello_timer = self.timers.schedule(
+                self.config['session']['hello_timeout'], self.dispatcher.post, self.on_hello_timeout)
+            self.mqtt.send_hello(audio_params=hello_audio_params(self.config['audio']['opus']))
+
+    def on_hello_timeout(self):
+        # 预热和唤醒的 hello 都有截止时间，超时后允许重新发送 hello
+        session = self.session
+        if session.ready.is_set() or not session.hello_pending:
+            return
+        logger.warning("hello 握手超时")
+        session.hello_pending = False
+        if session.state == Status.Listening:
+            session.terminate()
+            if self.restart is not None:
+                self.restart()
+
+    def prewarm(self):
+        # 空闲时提前完成 hello 握手，唤醒后直接发送音频
+        if self.config['session']['prewarm'] and self.session.state == Status.Idle:
+            self.send_hello()
+
+    def wake(self):
+        """
+        检测到唤醒词：开始聆听，UDP 通道就绪后发送唤醒词和 IoT 状态.
+        不等 hello 完成，返回是否开始了聆听，可以在检测线程和事件循环线程里调用；需要通道的
+        调用方自己等 session.ready，超时后由 hello 截止时间的定时器结束会话.
+        播报中打开了 barge_in 时打断播报.
+        """
+        session = self.session
+        if session.state == Status.Speaking and self.config['session']['barge_in']['enabled']:
+            return self.interrupt()
+        if session.state != Status.Idle:
+            return False
+        if not session.begin_listening():
+            return False
+        with self._wake_lock:
+            self._wake_pending = True
+        self.send_hello()
+        self._announce_wake()
+        return True
+
+    def interrupt(self):
+        """
+        打断播报：先切到聆听，之后到达的下行包直接丢弃，再清空抖动缓冲、解码器和播放缓冲，
+        最后通知服务端中止 tts 并开始聆听. 唤醒词所在的预录音频跟着上行发送.
+        """
+        detected_at = time.monotonic()
+        session = self.session
+        if session.state != Status.Speaking or not session.ready.is_set():
+            return False
+        session_id = session.id
+        session.begin_listening()
+        self.flush_downlink(trigger=detected_at)
+        self.mqtt.send_abort(session_id=session_id)
+        self.mqtt.send_start_auto_listening(session_id=session_id)
+        self.interrupts += 1
+        logger.info("打断播报，切到聆听用时 %.1f ms", (time.monotonic() - detected_at) * 1000)
+        return True
+
+    def _announce_wake(self):
+        # wake() 和 open_audio_channel() 都会调用，只有通道就绪后的第一次真正发送
+        session = self.session
+        with self._wake_lock:
+            if not self._wake_pending or not session.ready.is_set() or session.state != Status.Listening:
+                return
+            self._wake_pending = False
+        self.mqtt.send_wake_word_detected(
+            session_id=session.id,
+            wake_word=self.config['snowboy']['wake_word']
+            )
+        self.publish_iot_states()
+
+    def publish_iot_states(self):
+        # 只发和本会话上次上报相比变化的属性，没有变化就不发
+        session = self.session
+        if self.mqtt is None or not session.ready.is_set():
+            return
+        session_id = session.id
+        self.mqtt.send_iot_states(session_id=session_id, states=lambda: self.things.states_delta(session_id))
+
+    def on_reconnect(self):
+        """MQTT 重连成功后调用. 服务端的会话随连接失效，需要重新 hello."""
+        session = self.session
+        if session.state == Status.Listening and session.ready.is_set():
+            # 聆听中：重新建立会话，期间的麦克风音频排队，hello 完成后接着发
+            logger.info("MQTT 重连，恢复聆听中的会话")
+            session.suspend()
+            self.send_hello()
+        elif session.state == Status.Speaking:
+            # 播报中：下行音频已经中断，结束这次交互
+            self.flush_downlink()
+            session.terminate()
+            if self.restart is not None:
+                self.restart()
+            self.prewarm()
+        elif session.state == Status.Idle and session.ready.is_set():
+            # 预热的会话失效，重新预热
+            session.terminate()
+            self.prewarm()
+
+    def hello_handler(self, msg):
+        session = self.session
+        session.id = msg.session_id
+
+        udp = msg['udp']
+        session.udp_server = udp['server']
+        session.udp_port = udp['port']
+        session.udp_encryption = udp['encryption']
+        session.udp_key = udp['key']
+        session.udp_nonce = udp['nonce']
+        session.open_sealer()
+
+        audio_params = msg['audio_params']
+        session.server_audio_params_sample_rate = audio_params['sample_rate']
+        session.server_audio_params_format = audio_params['format']
+        session.server_audio_params_channels = audio_params['channels']
+        session.server_audio_params_frame_duration = audio_params['frame_duration']
+        self.transport.submit(self.open_audio_channel())
+
+    async def open_audio_channel(self):
+        await self.session.open_udp(self.output)
+        if self._hello_timer is not None:
+            self._hello_timer.cancel()
+            self._hello_timer = None
+        self.session.set_ready()
+        self.mqtt.send_iot_descriptors(session_id=self.session.id, descriptors=self.things.descriptors)
+        self._announce_wake()
+
+    def goodbye_handler(self, msg):
+        self.flush_downlink()
+        if msg.session_id is not None:
+            self.mqtt.send_goodbye(session_id=msg.session_id)
+        if self.session.id == msg.session_id:
+            self.session.terminate()
+            self.transport.call_later(self.config['session']['prewarm_delay'], self.prewarm)
+        if self.restart is not None:
+            self.restart()
+
+    def tts_start_handler(self, msg):
+        session = self.session
+        if session.state == Status.Idle or session.state == Status.Listening:
+            session.set_state(state=Status.Speaking, trigger=msg.received)
+            if self.rearm is not None and self.config['session']['barge_in']['enabled']:
+                self.rearm()
+
+    def tts_stop_handler(self, msg):
+        session = self.session
+        if session.state == Status.Speaking:
+            self.mqtt.send_start_auto_listening(session_id=session.id)
+            # 等扬声器里的尾音放完再开始聆听，避免把自己的声音录进去
+            self.timers.schedule(self.config['session']['echo_guard_ms'] / 1000,
+                                 self.dispatcher.post, self.start_listening)
+
+    def tts_sentence_handler(self, msg):
+        self.machine.refresh()
+        self.session.display.show_text(f"助手说:{msg['text']}")
+
+    def start_listening(self):
+        if self.session.state == Status.Speaking:
+            self.flush_downlink()
+            self.session.set_state(state=Status.Listening)
+
+    def iot_handler(self, msg):
+        for command in msg.get('commands', []):
+            self.things.invoke(command)
+
+    def default_handler(self, msg):
+        logger.debug("default_handler: %s", msg)
+
+    def stt_handler(self, msg):
+        self.machine.refresh()
+        self.session.display.show_text(f"我说:{msg['text']}")
+
+    def on_state_timeout(self, state):
+        session = self.session
+        if state == Status.Idle:
+            # 长时间没有交互，关闭预热的会话，下一次唤醒重新握手
+            if session.ready.is_set():
+                logger.info("关闭空闲会话")
+                self.mqtt.send_goodbye(session_id=session.id)
+                session.terminate()
+            return
+        # 聆听或播报中服务端没有下文(比如 goodbye 丢了)，主动结束会话
+        logger.warning("%s 超时，结束会话", state.name)
+        if session.id is not None:
+            self.mqtt.send_goodbye(session_id=session.id)
+        self.flush_downlink()
+        session.terminate()
+        if self.restart is not None:
+            self.restart()
+        self.transport.call_later(self.config['session']['prewarm_delay'], self.prewarm)
@@ -0,0 +1,69 @@
+import math
+import random
+import struct
+import wave
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+
+class FileSource:
+    """
+    循环播放 16kHz 单声道 16bit WAV 的虚拟麦克风，fleet 模式用.
+
+    文件只读一次，多台设备用同一个文件时可以共享 pcm，各自从不同偏移开始，避免所有设备同相.
+    """
+
+    def __init__(self, chunk_bytes, path=None, pcm=None, offset=0):
+        if pcm is None:
+            pcm = load_wav(path)
+        if len(pcm) < chunk_bytes:
+            raise ValueError("audio source shorter than one chunk")
+        self.pcm = pcm
+        self.chunk_bytes = chunk_bytes
+        self._view = memoryview(pcm)
+        self._offset = offset % len(pcm)
+        self._offset -= self._offset % SAMPLE_WIDTH
+
+    def read_chunk(self):
+        end = self._offset + self.chunk_bytes
+        if end <= len(self.pcm):
+            chunk = bytes(self._view[self._offset:end])
+            self._offset = end % len(self.pcm)
+            return chunk
+        tail = bytes(self._view[self._offset:])
+        self._offset = end - len(self.pcm)
+        return tail + bytes(self._view[:self._offset])
+
+
+def frame_bytes(opus: dict):
+    """一帧 opus 对应的 PCM 字节数，按配置里的采样率、声道数和帧长计算."""
+    return opus['sample_rate'] * opus['channels'] * SAMPLE_WIDTH * opus['frame_duration'] // 1000
+
+
+def load_wav(path):
+    with wave.open(path, "rb") as wav:
+        if wav.getframerate() != SAMPLE_RATE or wav.getnchannels() != 1 or wav.getsampwidth() != SAMPLE_WIDTH:
+            raise ValueError(f"{path}: 需要 16kHz 单声道 16bit WAV")
+        return wav.readframes(wav.getnframes())
+
+
+def synthetic_speech(seconds=4, seed=1):
+    """
+    合成的类语音信号：前半段是带基频抖动和音节包络的谐波加噪声，后半段是底噪.
+    只在启动时生成一次，由 FileSource 循环读取.
+    """
+    rng = random.Random(seed)
+    voiced_samples = seconds * SAMPLE_RATE // 2
+    samples = []
+    for n in range(seconds * SAMPLE_RATE):
+        t = n / SAMPLE_RATE
+        if n < voiced_samples:
+            pitch = 150 + 30 * math.sin(2 * math.pi * 0.7 * t)
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 4 * t)
+            voiced = sum(math.sin(2 * math.pi * pitch * h * t) / h for h in range(1, 8))
+            value = 4000 * envelope * voiced + rng.gauss(0, 300)
+        else:
+            value = rng.gauss(0, 30)
+        samples.append(max(-32768, min(32767, int(value))))
+    return struct.pack(f"<{len(samples)}h", *samples)
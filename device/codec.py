@@ -0,0 +1,40 @@
+import opuslib
+import opuslib.api.ctl
+import opuslib.api.encoder
+
+# opus 支持的帧长(毫秒)
+FRAME_DURATIONS = (10, 20, 40, 60)
+# DTX 打开后静音期间编码出的帧不超过这个长度，不需要发送
+DTX_FRAME_BYTES = 2
+
+
+def create_encoder(opus: dict):
+    """按 audio.opus 配置创建上行编码器，每个会话一个实例，不跨线程共享."""
+    if opus['frame_duration'] not in FRAME_DURATIONS:
+        raise ValueError(f"unsupported opus frame_duration: {opus['frame_duration']}")
+    encoder = opuslib.Encoder(opus['sample_rate'], opus['channels'], opuslib.APPLICATION_VOIP)
+    encoder.complexity = opus['complexity']
+    if opus['bitrate'] != 'auto':
+        encoder.bitrate = opus['bitrate']
+    set_dtx(encoder, opus['dtx'])
+    return encoder
+
+
+def create_decoder(sample_rate, channels):
+    """创建下行解码器，采样率和声道数按播放端，和服务端编码用的参数无关."""
+    return opuslib.Decoder(sample_rate, channels)
+
+
+def set_dtx(encoder, enabled):
+    # opuslib 的 Encoder.dtx setter 调用的是 get_dtx，这里直接走 encoder_ctl
+    opuslib.api.encoder.encoder_ctl(encoder.encoder_state, opuslib.api.ctl.set_dtx, int(enabled))
+
+
+def hello_audio_params(opus: dict):
+    """send_hello 里声明的上行音频参数，和编码器保持一致."""
+    return {
+        "format": "opus",
+        "sample_rate": opus['sample_rate'],
+        "channels": opus['channels'],
+        "frame_duration": opus['frame_duration'],
+    }
@@ -0,0 +1,86 @@
+import audioop
+import threading
+
+
+class EchoReference:
+    """
+    扬声器的播放参考信号，播报中检测唤醒词时用来削弱自己的声音.
+
+    PlaybackEngine 在回调里 feed() 送给声卡的 PCM 和它开始播放的时间，转成麦克风采样率后保留最近
+    history_ms. subtract() 按麦克风音频的采集时间往前推 delay_ms，在前后 search_ms 内找最吻合的
+    参考段，用最小二乘估计一个增益后减掉. 只是粗略的回声削弱，不是完整的回声消除.
+    EchoCanceller 用 locate()/read() 按参考流里的字节位置连续读取.
+    """
+
+    def __init__(self, barge_in: dict, rate=24000, mic_rate=16000, sample_width=2):
+        self.rate = rate
+        self.mic_rate = mic_rate
+        self.sample_width = sample_width
+        self.delay = barge_in['delay_ms'] / 1000
+        self.search = mic_rate * barge_in['search_ms'] // 1000 * sample_width
+        self.min_rms = barge_in['min_rms']
+        self.capacity = mic_rate * sample_width * barge_in['history_ms'] // 1000
+        self._buffer = bytearray()
+        # 参考流累计写入的字节数，缓冲里是最后 len(_buffer) 个字节
+        self._written = 0
+        # 缓冲里最后一个采样播放完的时间
+        self._end = None
+        self._ratecv_state = None
+        self._lock = threading.Lock()
+        self.subtracted = 0
+        self.missed = 0
+
+    def feed(self, pcm, played_at):
+        """PortAudio 播放回调里调用，played_at 是 pcm 第一个采样到达扬声器的时间."""
+        converted, self._ratecv_state = audioop.ratecv(
+            pcm, self.sample_width, 1, self.rate, self.mic_rate, self._ratecv_state)
+        with self._lock:
+            self._buffer += converted
+            self._written += len(converted)
+            excess = len(self._buffer) - self.capacity
+            if excess > 0:
+                del self._buffer[:excess]
+            self._end = played_at + len(pcm) / (self.rate * self.sample_width)
+
+    def locate(self, at):
+        """at 时刻播放的采样在参考流里的字节位置，还没有播放过时返回 None."""
+        with self._lock:
+            if self._end is None:
+                return None
+            return self._position_locked(at)
+
+    def _position_locked(self, at):
+        return self._written - round((self._end - at) * self.mic_rate) * self.sample_width
+
+    def read(self, position, size):
+        """参考流里从 position 开始的 size 字节，已经不在缓冲里或者还没播放到时返回 None."""
+        with self._lock:
+            offset = position - (self._written - len(self._buffer))
+            if offset < 0 or offset + size > len(self._buffer):
+                return None
+            return bytes(self._buffer[offset:offset + size])
+
+    def subtract(self, pcm, captured_at):
+        """captured_at 是 pcm 最后一个采样的采集时间，返回减掉回声后的 pcm."""
+        with self._lock:
+            if self._end is None:
+                return pcm
+            start = captured_at - len(pcm) / (self.mic_rate * self.sample_width) - self.delay
+            offset = self._position_locked(start) - (self._written - len(self._buffer))
+            low = max(0, offset - self.search)
+            high = offset + len(pcm) + self.search
+            window = bytes(self._buffer[low:high]) if high - low >= len(pcm) else b""
+        if len(window) < len(pcm):
+            # 参考信号已经不在缓冲里，或者还没播放到
+            self.missed += 1
+            return pcm
+        if audioop.rms(window, self.sample_width) < self.min_rms:
+            return pcm
+        position, _ = audioop.findfit(window, pcm)
+        position *= self.sample_width
+        reference = window[position:position + len(pcm)]
+        factor = audioop.findfactor(pcm, reference)
+        if factor <= 0:
+            return pcm
+        self.subtracted += 1
+        return audioop.add(pcm, audioop.mul(reference, self.sample_width, -factor), self.sample_width)
@@ -0,0 +1,140 @@
+import time
+
+import numpy as np
+
+from metrics import LatencyStats
+from .echo import EchoReference
+
+
+class EchoCanceller:
+    """
+    分块频域 NLMS 回声消除(多分块重叠保留)，在唤醒词检测线程里运行，不占用麦克风回调，
+    唤醒词检测和上行编码拿到的都是处理后的音频.
+
+    参考信号来自 EchoReference: 第一次按采集时间往前推 delay_ms 对齐，之后按采样数连续读取，
+    和按时间戳估计的位置差出 resync_ms 时重新对齐. 滤波器总长 filter_ms，按 block_ms 分块，
+    每块做一次 FFT；检测块(snowboy.chunk_ms)是块长整数倍时不增加延迟，否则最多晚一个块.
+    麦克风峰值超过近期参考信号峰值 double_talk 倍时认为近端有人说话，暂停更新滤波器.
+    参考信号静音超过滤波器长度时直接透传，不做 FFT.
+    """
+
+    def __init__(self, reference: EchoReference, echo_cancel: dict, mic_rate=16000, sample_width=2):
+        self.reference = reference
+        self.mic_rate = mic_rate
+        self.sample_width = sample_width
+        self.block = mic_rate * echo_cancel['block_ms'] // 1000
+        self.partitions = max(1, echo_cancel['filter_ms'] // echo_cancel['block_ms'])
+        self.delay = echo_cancel['delay_ms'] / 1000
+        self.resync = mic_rate * echo_cancel['resync_ms'] // 1000 * sample_width
+        self.step = echo_cancel['step']
+        self.double_talk = echo_cancel['double_talk']
+        self.min_rms = echo_cancel['min_rms']
+        # 正则项: 参考信号在 min_rms 附近时不让步长放大
+        self._regularization = (2 * self.block * self.min_rms) ** 2
+        bins = self.block + 1
+        self._weights = np.zeros((self.partitions, bins), np.complex128)
+        # 最近几块参考信号(连同前一块)的频谱，第 0 行最新
+        self._spectra = np.zeros((self.partitions, bins), np.complex128)
+        self._power = np.zeros(bins)
+        self._previous = np.zeros(self.block)
+        self._peaks = np.zeros(self.partitions)
+        self._silent = self.partitions
+        self._mic = np.zeros(0)
+        self._far = np.zeros(0)
+        self._cursor = None
+        self.latency = LatencyStats("echo_cancel")
+        self.blocks = 0
+        self.bypassed = 0
+        self.frozen = 0
+        self.resyncs = 0
+        self.missed = 0
+
+    @property
+    def stats(self):
+        return {
+            "blocks": self.blocks,
+            "bypassed": self.bypassed,
+            "frozen": self.frozen,
+            "resyncs": self.resyncs,
+            "missed": self.missed,
+            "latency": self.latency.summary(),
+        }
+
+    def reset(self):
+        self._weights[:] = 0
+        self._spectra[:] = 0
+        self._power[:] = 0
+        self._previous[:] = 0
+        self._peaks[:] = 0
+        self._silent = self.partitions
+
+    def process(self, pcm, captured_at):
+        """captured_at 是 pcm 最后一个采样的采集时间，返回消除回声后的 pcm."""
+        begin = time.perf_counter()
+        start = captured_at - len(pcm) / (self.mic_rate * self.sample_width) - self.delay
+        expected = self.reference.locate(start)
+        if expected is None:
+            # 还没有播放过
+            return pcm
+        if self._cursor is None or abs(self._cursor - expected) > self.resync:
+            if self._cursor is not None:
+                # 播放或采集断过(比如声卡 underrun)，按时间戳重新对齐
+                self.resyncs += 1
+                self.reset()
+            self._cursor = expected - expected % self.sample_width
+        far = self.reference.read(self._cursor, len(pcm))
+        self._cursor += len(pcm)
+        mic = np.frombuffer(pcm, np.int16)
+        if far is None:
+            self.missed += 1
+            far = np.zeros(len(mic))
+        else:
+            far = np.frombuffer(far, np.int16)
+        self._mic = np.concatenate((self._mic, mic))
+        self._far = np.concatenate((self._far, far))
+
+        block = self.block
+        count = len(self._mic) // block
+        output = np.empty(count * block)
+        for index in range(count):
+            span = slice(index * block, (index + 1) * block)
+            output[span] = self._process_block(self._mic[span], self._far[span])
+        self._mic = self._mic[count * block:]
+        self._far = self._far[count * block:]
+        self.latency.record(time.perf_counter() - begin)
+        return np.clip(output, -32768, 32767).astype(np.int16).tobytes()
+
+    def _process_block(self, mic, far):
+        self.blocks += 1
+        self._peaks = np.roll(self._peaks, 1)
+        self._peaks[0] = np.abs(far).max()
+        if np.sqrt(np.mean(far * far)) < self.min_rms:
+            self._silent += 1
+        else:
+            self._silent = 0
+        if self._silent >= self.partitions:
+            # 滤波器覆盖的参考信号都是静音，没有回声可消
+            if self._silent == self.partitions:
+                self._spectra[:] = 0
+                self._previous[:] = 0
+            self.bypassed += 1
+            return mic
+
+        block = self.block
+        self._spectra = np.roll(self._spectra, 1, axis=0)
+        self._spectra[0] = np.fft.rfft(np.concatenate((self._previous, far)))
+        self._previous = far
+        echo = np.fft.irfft((self._weights * self._spectra).sum(axis=0))[block:]
+        error = mic - echo
+
+        if np.abs(mic).max() > self.double_talk * self._peaks.max():
+            self.frozen += 1
+            return error
+        power = (self._spectra.real ** 2 + self._spectra.imag ** 2).sum(axis=0)
+        self._power = 0.9 * self._power + 0.1 * power if self._power.any() else power
+        spectrum = np.fft.rfft(np.concatenate((np.zeros(block), error)))
+        gradient = np.conj(self._spectra) * (self.step * spectrum / (self._power + self._regularization))
+        # 约束成线性卷积: 每个分块的时域系数只保留前一半
+        taps = np.fft.irfft(gradient, axis=1)[:, :block]
+        self._weights += np.fft.rfft(taps, n=2 * block, axis=1)
+        return error
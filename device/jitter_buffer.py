@@ -0,0 +1,204 @@
+import math
+import threading
+import time
+import logging
+
+from metrics import RateMeter
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_MASK = 0xFFFFFFFF
+# 序号回退超过这个帧数认为服务端重新开始了一段音频，而不是迟到包
+RESET_DISTANCE = 100
+
+
+def sequence_distance(a, b):
+    """返回 a - b，按 32 位序号回绕处理."""
+    diff = (a - b) & SEQUENCE_MASK
+    return diff - (SEQUENCE_MASK + 1) if diff & 0x80000000 else diff
+
+
+class JitterBuffer:
+    """
+    下行抖动缓冲.
+
+    UDP 通道在事件循环里按包头序号 put() opus 包，缓冲够深后同一个事件循环按帧间隔
+    call_at 取出、解码后交给 output，不为每个会话单独起播放线程，output 不能阻塞.
+    目标深度随到达抖动自适应调整，乱序包按序号重排，迟到包和重复包丢弃，
+    中间缺帧时如果下一帧已经到达就用它携带的 in-band FEC 恢复，否则用 opus PLC 补齐.
+    flush() 之后解码器状态重置，正在解码的那一帧也不再输出.
+    """
+
+    def __init__(self, loop, decoder, output, frame_duration=60, sample_rate=24000,
+                 min_depth=2, max_depth=8):
+        self.loop = loop
+        self.decoder = decoder
+        self.output = output
+        self.frame_duration = frame_duration
+        self.frame_size = sample_rate * frame_duration // 1000
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+
+        self.target_depth = min_depth
+        self.jitter = 0.0
+        self.stats = RateMeter("jitter_buffer")
+
+        self._packets = {}
+        self._next_sequence = None
+        self._highest_sequence = None
+        self._last_arrival = None
+        self._last_arrival_sequence = None
+        self._playing = False
+        self._epoch = 0
+        self._reset_decoder = False
+        self._lock = threading.Lock()
+        # 下一次出帧的时间和定时器，只在事件循环线程里读写
+        self._deadline = None
+        self._tick = None
+        self.running = False
+
+    @property
+    def depth(self):
+        return len(self._packets)
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        """可以在任意线程调用，已经排好的那次出帧看到 running 为 False 后不再继续."""
+        with self._lock:
+            self.running = False
+
+    def flush(self):
+        with self._lock:
+            self._packets.clear()
+            self._next_sequence = None
+            self._highest_sequence = None
+            self._last_arrival = None
+            self._playing = False
+            self._epoch += 1
+            self._reset_decoder = True
+
+    def put(self, sequence, opus_frame):
+        now = time.monotonic()
+        with self._lock:
+            self._update_jitter(sequence, now)
+            if self._next_sequence is not None:
+                distance = sequence_distance(sequence, self._next_sequence)
+                if distance < -RESET_DISTANCE:
+                    logger.debug("jitter buffer reset, sequence %d -> %d", self._next_sequence, sequence)
+                    self._packets.clear()
+                    self._next_sequence = None
+                    self._highest_sequence = None
+                    self._playing = False
+                elif distance < 0:
+                    self.stats.add("late_drops")
+                    return
+            if sequence in self._packets:
+                self.stats.add("duplicates")
+                return
+            self._packets[sequence] = bytes(opus_frame)
+            self.stats.add("received")
+            if self._highest_sequence is None or sequence_distance(sequence, self._highest_sequence) > 0:
+                self._highest_sequence = sequence
+            else:
+                # 比已经到达的包序号小，但还赶得上播放
+                self.stats.add("reordered")
+            if not self._playing and len(self._packets) >= self.target_depth:
+                self._playing = True
+        if self._playing and self._tick is None:
+            self._deadline = None
+            self._tick = self.loop.call_soon(self._play)
+
+    def _update_jitter(self, sequence, now):
+        # RFC 3550 式到达抖动估计，换算成需要缓冲的帧数
+        if self._last_arrival is not None:
+            frames = sequence_distance(sequence, self._last_arrival_sequence)
+            transit = (now - self._last_arrival) * 1000 - frames * self.frame_duration
+            self.jitter += (abs(transit) - self.jitter) / 16
+            depth = 1 + math.ceil(2 * self.jitter / self.frame_duration)
+            self.target_depth = max(self.min_depth, min(self.max_depth, depth))
+        self._last_arrival = now
+        self._last_arrival_sequence = sequence
+
+    def _oldest_locked(self):
+        anchor = self._next_sequence
+        if anchor is None:
+            anchor = next(iter(self._packets))
+        return min(self._packets, key=lambda s: sequence_distance(s, anchor))
+
+    @property
+    def counters(self):
+        """会话内累计的接收/丢包/乱序/补偿计数."""
+        totals = self.stats.totals
+        return {field: totals.get(field, 0) for field in (
+            "received", "played", "lost", "fec_recovered", "concealed",
+            "reordered", "late_drops", "duplicates", "underruns", "overflow_drops")}
+
+    def _pop_locked(self):
+        """
+        取出下一帧，返回 (opus 包, 是否按 FEC 解码)；缺帧且没有 FEC 时 opus 包为 None (PLC)，
+        缓冲为空时返回 False.
+        """
+        if not self._packets:
+            self._playing = False
+            self.stats.add("underruns")
+            return False
+        oldest = self._oldest_locked()
+        if self._next_sequence is None or sequence_distance(oldest, self._next_sequence) > self.max_depth:
+            self._next_sequence = oldest
+        while len(self._packets) > self.max_depth:
+            # 缓冲过深时丢掉最旧的帧，限制播放延迟
+            del self._packets[oldest]
+            self._next_sequence = (oldest + 1) & SEQUENCE_MASK
+            self.stats.add("overflow_drops")
+            oldest = self._oldest_locked()
+        opus_frame = self._packets.pop(self._next_sequence, None)
+        self._next_sequence = (self._next_sequence + 1) & SEQUENCE_MASK
+        if opus_frame is not None:
+            self.stats.add("played")
+            return opus_frame, False
+        self.stats.add("lost")
+        # 下一帧已经到了，用它携带的上一帧 FEC 数据恢复，下一帧本身之后照常解码
+        following = self._packets.get(self._next_sequence)
+        if following is not None:
+            self.stats.add("fec_recovered")
+            return following, True
+        self.stats.add("concealed")
+        return None, False
+
+    def _play(self):
+        with self._lock:
+            if not self.running or not self._playing:
+                self._tick = None
+                return
+            frame = self._pop_locked()
+            epoch = self._epoch
+            reset, self._reset_decoder = self._reset_decoder, False
+        if reset:
+            # 解码器只在出帧时使用，flush 可能在其他线程，不能直接重置
+            self.decoder.reset_state()
+        if frame is False:
+            # 缓冲空了，等 put() 攒够目标深度再开始
+            self._tick = None
+            return
+        self._decode(frame, epoch)
+        period = self.frame_duration / 1000
+        now = self.loop.time()
+        if self._deadline is None or self._deadline < now - period:
+            self._deadline = now
+        self._deadline += period
+        self._tick = self.loop.call_at(self._deadline, self._play)
+
+    def _decode(self, frame, epoch):
+        opus_frame, fec = frame
+        try:
+            # 空包触发 opus 的丢包补偿
+            pcm = self.decoder.decode(opus_frame or b"", self.frame_size, decode_fec=fec)
+        except Exception as e:
+            logger.warning("opus decode error %s", e)
+            return
+        if epoch != self._epoch:
+            # 解码期间被 flush 了
+            return
+        self.output(pcm)
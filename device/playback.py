@@ -0,0 +1,149 @@
+import logging
+import time
+
+import pyaudio
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+
+class PcmRing:
+    """
+    单生产者单消费者的 PCM 环形缓冲.
+
+    写线程只改 _write，回调线程只改 _read，两个计数单调递增，不需要加锁.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._read = 0
+        self._write = 0
+
+    @property
+    def written(self):
+        return self._write
+
+    def __len__(self):
+        return self._write - self._read
+
+    def write(self, data) -> int:
+        size = min(len(data), self.capacity - len(self))
+        size -= size % 2
+        position = self._write % self.capacity
+        first = min(size, self.capacity - position)
+        self._buffer[position:position + first] = data[:first]
+        self._buffer[:size - first] = data[first:size]
+        self._write += size
+        return size
+
+    def read(self, size: int) -> bytes:
+        size = min(size, len(self))
+        position = self._read % self.capacity
+        first = min(size, self.capacity - position)
+        data = bytes(self._buffer[position:position + first])
+        if first < size:
+            data += self._buffer[:size - first]
+        self._read += size
+        return data
+
+    def discard(self, upto: int):
+        if upto > self._read:
+            self._read = upto
+
+
+class PlaybackEngine:
+    """
+    回调模式的下行播放.
+
+    网络侧 write() 只往环形缓冲里拷贝数据，声卡按自己的节奏在 PortAudio 回调里取，
+    播放中缓冲取空时补静音并记一次 underrun，写满时丢弃新数据并记一次 overrun.
+    flush() 让下一次回调直接跳过已排队的音频，传入 trigger(打断的时间)时记录到扬声器静音的延迟.
+    echo_reference 收到每次回调实际播放的 PCM，给唤醒词检测做回声参考.
+    """
+
+    def __init__(self, audio: pyaudio.PyAudio, playback: dict, rate=24000, sample_width=2,
+                 echo_reference=None):
+        self.audio = audio
+        self.rate = rate
+        self.sample_width = sample_width
+        self.frames_per_buffer = playback['frames_per_buffer']
+        self.ring = PcmRing(rate * sample_width * playback['buffer_ms'] // 1000)
+        self.underruns = 0
+        self.overruns = 0
+        self.dropped_bytes = 0
+        self.echo_reference = echo_reference
+        self.silence_latency = LatencyStats("interrupt_to_silence")
+        self._flush_to = 0
+        self._flush_trigger = None
+        self._output_latency = 0.0
+        self._starved = True
+        self.stream = None
+
+    @property
+    def stats(self):
+        return {
+            "buffered_ms": len(self.ring) * 1000 // (self.rate * self.sample_width),
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "dropped_bytes": self.dropped_bytes,
+            "interrupt_to_silence": self.silence_latency.summary(),
+        }
+
+    def start(self):
+        self.stream = self.audio.open(
+            format=self.audio.get_format_from_width(self.sample_width),
+            channels=1,
+            rate=self.rate,
+            input=False,
+            output=True,
+            frames_per_buffer=self.frames_per_buffer,
+            stream_callback=self._stream_callback)
+        self._output_latency = self.stream.get_output_latency()
+        self.stream.start_stream()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    def write(self, pcm):
+        written = self.ring.write(pcm)
+        if written < len(pcm):
+            self.overruns += 1
+            self.dropped_bytes += len(pcm) - written
+
+    def flush(self, trigger=None):
+        self._flush_to = self.ring.written
+        if trigger is not None:
+            # 先设 _flush_to: 回调看到 trigger 时一定也会跳过排队的音频
+            self._flush_trigger = trigger
+
+    def _stream_callback(self, in_data, frame_count, time_info, status):
+        trigger, self._flush_trigger = self._flush_trigger, None
+        self.ring.discard(self._flush_to)
+        size = frame_count * self.sample_width
+        data = self.ring.read(size)
+        if len(data) < size:
+            if not self._starved:
+                self._starved = True
+                self.underruns += 1
+            data += bytes(size - len(data))
+        else:
+            self._starved = False
+        if trigger is not None or self.echo_reference is not None:
+            played_at = time.monotonic() + self._output_delay(time_info)
+            if trigger is not None:
+                self.silence_latency.record(played_at - trigger)
+            if self.echo_reference is not None:
+                self.echo_reference.feed(data, played_at)
+        return data, pyaudio.paContinue
+
+    def _output_delay(self, time_info):
+        # 这次回调的数据多久以后到达扬声器，有的后端不提供 DAC 时间，用流的输出延迟代替
+        delay = time_info['output_buffer_dac_time'] - time_info['current_time']
+        if delay <= 0:
+            delay = self._output_latency
+        return delay
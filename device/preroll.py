@@ -0,0 +1,46 @@
+import collections
+import time
+
+
+class PrerollBuffer:
+    """
+    唤醒前的麦克风音频，只保留最近 duration_ms.
+
+    每块音频记录回调时刻，snapshot() 精确截取最后 duration_ms 并给出第一个采样的采集时间，
+    让服务端 ASR 能拿到完整的唤醒词.
+    """
+
+    def __init__(self, duration_ms, sample_rate=16000, sample_width=2):
+        self.duration_ms = duration_ms
+        self.bytes_per_second = sample_rate * sample_width
+        self.capacity = self.bytes_per_second * duration_ms // 1000
+        self.capacity -= self.capacity % sample_width
+        self._chunks = collections.deque()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, pcm, captured_at=None):
+        if captured_at is None:
+            captured_at = time.monotonic()
+        self._chunks.append((captured_at, pcm))
+        self._size += len(pcm)
+        while self._size - len(self._chunks[0][1]) >= self.capacity:
+            self._size -= len(self._chunks.popleft()[1])
+
+    def snapshot(self):
+        """返回 (第一个采样的采集时间, 最近 duration_ms 的 PCM) 并清空缓冲."""
+        if not self._chunks:
+            return None, b""
+        captured_at, first = self._chunks[0]
+        excess = max(0, self._size - self.capacity)
+        # 回调时刻是这一块最后一个采样的时间
+        started_at = captured_at - (len(first) - excess) / self.bytes_per_second
+        pcm = b"".join(chunk for _, chunk in self._chunks)[excess:]
+        self.clear()
+        return started_at, pcm
+
+    def clear(self):
+        self._chunks.clear()
+        self._size = 0
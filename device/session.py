@@ -1,25 +1,27 @@
-import struct
-import threading
 from .display import Display 
 from .status import Status
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
-import opuslib
-import socket
+from .udp_crypto import PacketSealer
+from .udp_channel import UdpChannel
+from .jitter_buffer import JitterBuffer
+from .preroll import PrerollBuffer
+from .uplink import UplinkPipeline
+from .codec import create_encoder, create_decoder, set_dtx, DTX_FRAME_BYTES
+from .vad import EnergyVad
+from metrics import LatencyStats
+import asyncio
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
-application = opuslib.APPLICATION_VOIP
-encoder = opuslib.Encoder(16000, 1, application)
-encoder.complexity = 5
-
-decoder = opuslib.Decoder(24000, 1)
-
 
 class Session:
-    def __init__(self):
+    def __init__(self, audio: dict, executor=None):
+        self.audio = audio
         self.state = Status.Unknown
+        # 状态转换的检查 on_state(old, new, trigger)，返回 False 时拒绝转换，由 StateMachine 设置
+        self.on_state = None
         self.display = Display()
         self.id = None
 
@@ -29,8 +31,16 @@ class Session:
         self.udp_key = None
         self.udp_nonce = None
         self.udp = None
-        self.receive_thread = None
-        self.receive_running = False
+        self.sealer = None
+        self.jitter_buffer = None
+
+        # 编解码器归会话所有：编码器按 audio.opus 创建，解码器在 hello 之后按服务端参数创建
+        opus = audio['opus']
+        self.encoder = create_encoder(opus)
+        self.decoder = None
+        self.frame_duration = opus['frame_duration']
+        self.frame_samples = opus['sample_rate'] * self.frame_duration // 1000
+        self.frame_bytes = self.frame_samples * opus['channels'] * 2
 
         self.server_audio_params_sample_rate = None
         self.server_audio_params_format = None
@@ -39,81 +49,257 @@ class Session:
 
         self.local_sequence = 0
 
-    def set_state(self, state):
+        # 未发送的上行 PCM，不足一帧的余量留到下一次
+        self.uplink = bytearray()
+        self.uplink_lock = threading.Lock()
+        self.pacing = False
+        # 正在按间隔发送排队音频的那个 UDP 通道
+        self._pacer_udp = None
+        self.preroll = PrerollBuffer(audio['preroll']['duration_ms'],
+                                     sample_rate=opus['sample_rate'] * opus['channels'])
+        bytes_per_ms = self.frame_bytes // self.frame_duration
+        self.max_pending_bytes = bytes_per_ms * audio['preroll']['max_pending_ms']
+        self.pending_dropped_bytes = 0
+        # PortAudio 回调只往这里 push，编码、加密和发送都在流水线的工作线程里
+        self.uplink_pipeline = UplinkPipeline(self.capture, audio['uplink'], executor=executor)
+
+        # 静音抑制: dtx 不发送 opus DTX 的 1-2 字节静音帧，vad 由本地 VAD 判静音后不编码也不发送.
+        # 序号只在真正发出的包上递增，服务端看到的序号保持连续
+        suppression = audio['uplink']['silence_suppression']
+        if suppression not in ('none', 'dtx', 'vad'):
+            raise ValueError(f"unknown silence_suppression: {suppression}")
+        self.suppress_dtx = suppression == 'dtx'
+        if self.suppress_dtx:
+            set_dtx(self.encoder, True)
+        self.uplink_vad = None
+        if suppression == 'vad':
+            vad = audio['uplink']['vad']
+            self.uplink_vad = EnergyVad(
+                energy_threshold=vad['energy_threshold'],
+                hangover_ms=vad['hangover_ms'],
+                sample_rate=opus['sample_rate'] * opus['channels'])
+        # VAD 判为静音的最后一帧，语音开始时先补发，避免截掉起音
+        self.onset_frame = None
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+
+        # hello 响应到达、UDP 通道可用时置位；预热模式下在两次交互之间保持
+        self.ready = threading.Event()
+        self.hello_pending = False
+        self.wake_at = None
+        self.wake_warm = False
+        self.wake_latency_warm = LatencyStats("wake_to_first_packet_warm")
+        self.wake_latency_cold = LatencyStats("wake_to_first_packet_cold")
+
+    def set_state(self, state, trigger=None):
+        """
+        trigger 是引起这次转换的事件时间(monotonic)，用来统计转换延迟.
+        返回是否切换了状态，非法的转换被拒绝，状态保持不变.
+        """
+        if self.on_state is not None and not self.on_state(self.state, state, trigger):
+            return False
         self.state = state
         self.display.show_text(self.state)
+        return True
 
     def terminate(self):
+        self._close_channel()
+        with self.uplink_lock:
+            self.uplink.clear()
+            self.pacing = False
+            self.wake_at = None
+            self.encoder.reset_state()
+            self._reset_suppression_locked()
+        self.set_state(Status.Idle)
+
+    def suspend(self):
+        """
+        MQTT 重连后服务端的会话已经失效：关闭 UDP 通道，保留聆听状态和待发送的音频，
+        重新 hello 之后由 set_ready() 接着发送.
+        """
+        self._close_channel()
+        with self.uplink_lock:
+            self.pacing = True
+            self.encoder.reset_state()
+
+    def _close_channel(self):
         self.id = None
         self.udp_server = None
         self.udp_port = None
         self.udp_encryption = None
         self.udp_key = None
         self.udp_nonce = None
-        self.local_sequence = 0
-        
-        self.receive_running = False
-        if self.udp is not None:
-            try:
-                self.udp.shutdown(socket.SHUT_RD)
-            except OSError as e:
-                logger.warn("\nServer shutting down...", e)
-                pass
-            if self.receive_thread:
-                self.receive_thread.join()  # 等待线程结束
-                self.receive_thread = None
-            self.udp.close()
-            self.udp = None
+        self.ready.clear()
+        self.hello_pending = False
+        with self.uplink_lock:
+            self.sealer = None
+            self.local_sequence = 0
+            udp, self.udp = self.udp, None
+
+        if udp is not None:
+            # 关闭交给事件循环，不需要等待接收线程
+            udp.close()
+        if self.jitter_buffer is not None:
+            self.jitter_buffer.stop()
+            logger.info("downlink %s", self.jitter_buffer.counters)
+            self.jitter_buffer = None
+        self.decoder = None
 
         self.server_audio_params_sample_rate = None
         self.server_audio_params_format = None
         self.server_audio_params_channels = None
         self.server_audio_params_frame_duration = None
 
-        self.set_state(Status.Idle)
-            
-    def upd_send_8(self, data):
-        if self.udp is None or self.udp_key is None or self.udp_nonce is None:
+    def flush_downlink(self):
+        if self.jitter_buffer is not None:
+            self.jitter_buffer.flush()
+
+    def open_sealer(self):
+        self.sealer = PacketSealer(self.udp_key, self.udp_nonce)
+
+    def capture(self, data):
+        """上行工作线程的入口：聆听中发往服务器，否则存入唤醒前的预录缓冲."""
+        with self.uplink_lock:
+            if self.state != Status.Listening:
+                self.preroll.append(data)
+                return
+            self._queue_locked(data)
+
+    def begin_listening(self):
+        """
+        唤醒后立即切换到聆听状态，冻结预录音频排在上行最前面，之后的麦克风音频排在它后面.
+        UDP 通道已经就绪(预热)时马上开始发送，否则等 set_ready(). 返回是否切到了聆听.
+        """
+        with self.uplink_lock:
+            wake_at = time.monotonic()
+            if not self.set_state(state=Status.Listening, trigger=wake_at):
+                return False
+            self.wake_at = wake_at
+            self.wake_warm = self.ready.is_set()
+            started_at, pcm = self.preroll.snapshot()
+            self.uplink[:0] = pcm
+            self.pacing = True
+            if self.wake_warm:
+                self._start_pacer()
+        if started_at is not None:
+            logger.debug("preroll %d ms, captured %.0f ms ago",
+                         len(pcm) // (self.frame_bytes // self.frame_duration),
+                         (wake_at - started_at) * 1000)
+        return True
+
+    def set_ready(self):
+        """hello 握手完成，如果唤醒后有排队的音频就开始发送."""
+        with self.uplink_lock:
+            self.hello_pending = False
+            self.ready.set()
+            if self.pacing:
+                self._start_pacer()
+
+    def _start_pacer(self):
+        # 持有 uplink_lock 时调用. 排队的音频由通道所在的事件循环按间隔逐帧发送，不单独起线程
+        if self._pacer_udp is self.udp:
             return
-        while len(data) >= 1920:
-            opus_frame = encoder.encode(data[:1920], 960)
-            data = data[1920:]
-
-            aes_key = bytes.fromhex(self.udp_key)
-            aes_nonce = bytearray.fromhex(self.udp_nonce)
-            self.local_sequence += 1
-            struct.pack_into("!H", aes_nonce, 2, len(opus_frame))
-            struct.pack_into("!I", aes_nonce, 12, self.local_sequence)
-
-            encrypted_payload = bytearray(aes_nonce)
-            encrypted_payload.extend(opus_frame)
-
-            cipher = Cipher(algorithms.AES(aes_key), modes.CTR(bytes(aes_nonce[:16])), backend=default_backend())
-            encryptor = cipher.encryptor()
-            ciphertext_data = encryptor.update(opus_frame) + encryptor.finalize()
-
-            encrypted_payload[len(aes_nonce):] = ciphertext_data
-            self.udp.send(encrypted_payload)
-            
-    def set_upd_receive_task(self, callback):
-        self.receive_running = True
-        def udp_receive_thread_function(self, callback):
-            try:
-                while self.receive_running:
-                    data, address = self.udp.recvfrom(1500)
-                    if len(data) < 16:
-                        continue
-                    # remote_sequence = struct.unpack('>I', data[12:16])
-                    # opus_frame_Len = struct.unpack('!H', data[2:4])
-
-                    cipher = Cipher(algorithms.AES(bytes.fromhex(self.udp_key)), modes.CTR(bytes(data[:16])), backend=default_backend())
-                    encryptor = cipher.decryptor()
-                    ciphertext_data = encryptor.update(data[16:]) + encryptor.finalize()
-                    pcm_data = decoder.decode(ciphertext_data, 24 * 60)
-                    if self.state == Status.Speaking:
-                        callback(pcm_data)
-            except Exception as e:
-                logger.warn("\nServer err...", e)
-
-        self.receive_thread = threading.Thread(target=udp_receive_thread_function, args=(self, callback), daemon=True)
-        self.receive_thread.start()
\ No newline at end of file
+        self._pacer_udp = self.udp
+        self.udp.loop.call_soon_threadsafe(self._pace_preroll, self.udp)
+
+    def _pace_preroll(self, udp):
+        with self.uplink_lock:
+            if self.udp is not udp:
+                # 通道关闭(会话结束或重连中)，pacing 由 terminate/suspend 决定
+                return
+            if len(self.uplink) < self.frame_bytes:
+                self.pacing = False
+                self._pacer_udp = None
+                return
+            self._send_frames_locked(limit=1)
+        udp.loop.call_later(self.frame_duration / 1000 / self.audio['preroll']['pace'], self._pace_preroll, udp)
+
+    def _queue_locked(self, data):
+        self.uplink += data
+        if not self.pacing:
+            self._send_frames_locked()
+            return
+        excess = len(self.uplink) - self.max_pending_bytes
+        if excess > 0:
+            # 握手迟迟不完成时丢掉最旧的整帧，限制排队内存
+            excess += -excess % self.frame_bytes
+            del self.uplink[:excess]
+            self.pending_dropped_bytes += excess
+
+    def _send_frames_locked(self, limit=None):
+        if self.udp is None or self.sealer is None:
+            return
+        frame_bytes = self.frame_bytes
+        count = len(self.uplink) // frame_bytes
+        if limit is not None:
+            count = min(count, limit)
+        for index in range(count):
+            offset = index * frame_bytes
+            pcm = bytes(self.uplink[offset:offset + frame_bytes])
+            if self.uplink_vad is not None:
+                if not self.uplink_vad.is_speech(pcm):
+                    if self.onset_frame is not None:
+                        self.frames_suppressed += 1
+                    self.onset_frame = pcm
+                    continue
+                if self.onset_frame is not None:
+                    self._send_frame_locked(self.onset_frame)
+                    self.onset_frame = None
+            self._send_frame_locked(pcm)
+        del self.uplink[:count * frame_bytes]
+
+    def _send_frame_locked(self, pcm):
+        opus_frame = self.encoder.encode(pcm, self.frame_samples)
+        if self.suppress_dtx and len(opus_frame) <= DTX_FRAME_BYTES:
+            self.frames_suppressed += 1
+            return
+        self.local_sequence += 1
+        self.udp.send(self.sealer.seal(opus_frame, self.local_sequence))
+        self.frames_sent += 1
+        if self.wake_at is not None:
+            latency = time.monotonic() - self.wake_at
+            stats = self.wake_latency_warm if self.wake_warm else self.wake_latency_cold
+            stats.record(latency)
+            logger.info("wake to first packet %.1f ms (%s)", latency * 1000,
+                        "warm" if self.wake_warm else "cold")
+            self.wake_at = None
+
+    def _reset_suppression_locked(self):
+        if self.onset_frame is not None:
+            self.frames_suppressed += 1
+            self.onset_frame = None
+        total = self.frames_sent + self.frames_suppressed
+        if total:
+            logger.info("uplink frames sent %d, suppressed %d (%.0f%%)",
+                        self.frames_sent, self.frames_suppressed,
+                        self.frames_suppressed * 100 / total)
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+        if self.uplink_vad is not None:
+            self.uplink_vad.reset()
+
+    async def open_udp(self, callback):
+        """
+        在事件循环里打开 hello 指定的 UDP 通道，下行音频经抖动缓冲解码后交给 callback.
+        抖动缓冲在这个事件循环里出帧和解码，callback 不能阻塞.
+        """
+        jitter = self.audio['jitter_buffer']
+        # opus 可以解码到任意支持的采样率，直接按播放的采样率和声道数解码
+        sample_rate = self.audio['playback']['sample_rate']
+        self.decoder = create_decoder(sample_rate, 1)
+        loop = asyncio.get_running_loop()
+        self.jitter_buffer = JitterBuffer(
+            loop, self.decoder, callback,
+            frame_duration=self.server_audio_params_frame_duration or 60,
+            sample_rate=sample_rate,
+            min_depth=jitter['min_depth'],
+            max_depth=jitter['max_depth'])
+        self.jitter_buffer.start()
+        jitter_buffer = self.jitter_buffer
+
+        def on_packet(sequence, opus_frame):
+            if self.state == Status.Speaking:
+                jitter_buffer.put(sequence, opus_frame)
+
+        self.udp = await UdpChannel.open(
+            loop, self.udp_server, self.udp_port, self.udp_key, on_packet)
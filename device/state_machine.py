@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+
+from metrics import LatencyStats
+from .status import Status
+
+logger = logging.getLogger(__name__)
+
+# 允许的状态转换，同一状态再次进入(比如空闲时关闭预热会话)会重新计时
+TRANSITIONS = {
+    Status.Unknown: {Status.Starting, Status.Idle},
+    Status.Starting: {Status.Idle},
+    Status.Idle: {Status.Idle, Status.Listening, Status.Speaking},
+    Status.Listening: {Status.Idle, Status.Listening, Status.Speaking},
+    Status.Speaking: {Status.Idle, Status.Listening},
+}
+
+
+class StateMachine:
+    """
+    会话状态机，挂在 Session.set_state 上.
+
+    检查状态转换是否合法，非法的转换计数后拒绝；进入状态时在时间轮上启动该状态的超时，离开时取消，
+    超时后回调 on_timeout(state)，由 Client 决定怎么结束会话. refresh() 在收到服务端的
+    stt/tts 等消息时重新计时. 记录每种转换从触发到完成的延迟和每个状态的停留时间.
+    """
+
+    def __init__(self, session, timers, timeouts: dict):
+        self.session = session
+        self.timers = timers
+        self.timeouts = {
+            Status.Listening: timeouts['listen_timeout'],
+            Status.Speaking: timeouts['speak_timeout'],
+            Status.Idle: timeouts['idle_timeout'],
+        }
+        self.on_timeout = None
+        self.time_in_state = {}
+        self.transition_latency = {}
+        self.invalid = 0
+        self.timeouts_fired = 0
+        self._entered = time.monotonic()
+        self._timer = None
+        self._lock = threading.Lock()
+        session.on_state = self._on_state
+
+    @property
+    def stats(self):
+        return {
+            "time_in_state": {state.name: stats.summary() for state, stats in self.time_in_state.items()},
+            "transitions": {name: stats.summary() for name, stats in self.transition_latency.items()},
+            "invalid": self.invalid,
+            "timeouts": self.timeouts_fired,
+        }
+
+    def _on_state(self, old, new, trigger):
+        now = time.monotonic()
+        if new not in TRANSITIONS.get(old, ()):
+            self.invalid += 1
+            logger.warning("拒绝非法的状态转换 %s -> %s", old.name, new.name)
+            return False
+        with self._lock:
+            self._record(self.time_in_state, old, old.name, now - self._entered)
+            self._entered = now
+            self._arm_locked(new)
+        name = f"{old.name}->{new.name}"
+        self._record(self.transition_latency, name, name, time.monotonic() - (trigger or now))
+        return True
+
+    def _record(self, table, key, name, seconds):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = LatencyStats(name)
+        stats.record(seconds)
+
+    def refresh(self):
+        """当前状态有进展(比如收到 stt、新的一句 tts)，超时重新计时."""
+        with self._lock:
+            self._arm_locked(self.session.state)
+
+    def _arm_locked(self, state):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        timeout = self.timeouts.get(state)
+        if timeout:
+            self._timer = self.timers.schedule(timeout, self._expired, state)
+
+    def _expired(self, state):
+        with self._lock:
+            if self.session.state != state:
+                return
+            self._timer = None
+        self.timeouts_fired += 1
+        logger.debug("%s 超时", state.name)
+        if self.on_timeout is not None:
+            self.on_timeout(state)
@@ -0,0 +1,141 @@
+import array
+import collections
+import socket
+import struct
+import logging
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    # Windows: 没有 FIONREAD，读到 BlockingIOError 为止
+    fcntl = None
+
+from metrics import RateMeter
+from .udp_crypto import HEADER_SIZE, PacketOpener
+
+logger = logging.getLogger(__name__)
+
+DATAGRAM_SIZE = 1500
+# 接收缓冲区环的槽数，payload 在之后 RING_SIZE - 1 个包到达前有效
+RING_SIZE = 8
+# 一次可读事件最多处理的包数，避免连续到达的包占住事件循环
+READ_BATCH = 64
+
+
+class UdpChannel:
+    """
+    会话的 UDP 音频通道，由 TransportLoop 的事件循环驱动.
+
+    下行不经过 asyncio 的数据报 transport: add_reader 监听 socket，可读时循环 recv_into
+    预分配的缓冲区环直到读空，在槽里原地解密，把 (sequence, payload) 交给 callback，
+    收包路径上不再分配缓冲区，stats 的 allocations 记录通道分配的缓冲区数. 读空用 FIONREAD
+    判断，不靠 BlockingIOError 结束循环. payload 指向环里的槽，需要保留的话由调用方复制.
+    上行 send() 可以在任意线程调用：包先进 deque，再由事件循环一次性 send 出去.
+    """
+
+    def __init__(self, loop, sock, key: str, callback, ring_size=RING_SIZE, datagram_size=DATAGRAM_SIZE):
+        self.loop = loop
+        self.sock = sock
+        self.callback = callback
+        self.opener = PacketOpener(key)
+        self.stats = RateMeter("udp_channel")
+        # 多留一个分组给 update_into
+        self._ring = [bytearray(datagram_size + 16) for _ in range(ring_size)]
+        self._views = [memoryview(slot) for slot in self._ring]
+        # 包头(nonce)和包体的切片也预先做好
+        self._nonces = [view[:HEADER_SIZE] for view in self._views]
+        self._bodies = [view[HEADER_SIZE:] for view in self._views]
+        self._slot = 0
+        self._pending = array.array("i", [0])
+        self.datagram_size = datagram_size
+        self.stats.add("allocations", ring_size)
+        self._outgoing = collections.deque()
+        self._drain_scheduled = False
+        self._closed = False
+        sock.setblocking(False)
+
+    @classmethod
+    async def open(cls, loop, host, port, key: str, callback):
+        """在事件循环里解析地址、打开并 connect UDP socket."""
+        family, kind, proto, _, address = (await loop.getaddrinfo(host, port, type=socket.SOCK_DGRAM))[0]
+        sock = socket.socket(family, kind, proto)
+        sock.connect(address)
+        channel = cls(loop, sock, key, callback)
+        channel.start()
+        return channel
+
+    def start(self):
+        """在事件循环线程里调用."""
+        self.loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        sock = self.sock
+        fd = sock.fileno()
+        views = self._views
+        opener = self.opener
+        slot = self._slot
+        datagram_size = self.datagram_size
+        packets = 0
+        received = 0
+        try:
+            while packets < READ_BATCH:
+                view = views[slot]
+                try:
+                    size = sock.recv_into(view, datagram_size)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError as exc:
+                    logger.warning("udp channel error %s", exc)
+                    break
+                packets += 1
+                received += size
+                if size >= HEADER_SIZE:
+                    sequence, = struct.unpack_from("!I", view, 12)
+                    payload = opener.decrypt(self._nonces[slot], self._bodies[slot], size - HEADER_SIZE)
+                    slot = (slot + 1) % len(views)
+                    self.callback(sequence, payload)
+                if fcntl is not None:
+                    fcntl.ioctl(fd, termios.FIONREAD, self._pending, True)
+                    if not self._pending[0]:
+                        break
+        finally:
+            self._slot = slot
+            if packets:
+                self.stats.add("packets", packets)
+                self.stats.add("bytes", received)
+
+    def send(self, packet):
+        """线程安全，packet 会被复制."""
+        self._outgoing.append(bytes(packet))
+        if not self._drain_scheduled:
+            self._drain_scheduled = True
+            self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        self._drain_scheduled = False
+        outgoing = self._outgoing
+        while outgoing:
+            packet = outgoing.popleft()
+            if self._closed:
+                continue
+            try:
+                self.sock.send(packet)
+                self.stats.add("sent")
+            except (BlockingIOError, InterruptedError):
+                # 发送缓冲满了，UDP 音频直接丢弃
+                self.stats.add("send_drops")
+            except OSError as exc:
+                logger.warning("udp channel send error %s", exc)
+
+    def close(self):
+        """线程安全，不需要等待."""
+        self.loop.call_soon_threadsafe(self._close)
+
+    def _close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._outgoing.clear()
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
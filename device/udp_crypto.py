@@ -0,0 +1,66 @@
+import struct
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+
+HEADER_SIZE = 16
+MAX_PAYLOAD_SIZE = 1500
+
+
+class PacketSealer:
+    """
+    上行 UDP 包加密器，每个会话在 hello 之后创建一次.
+
+    key/nonce 只解析一次，包头模板和密文写在同一块复用的缓冲区里，
+    seal() 返回的 memoryview 在下一次调用前有效.
+    """
+
+    def __init__(self, key: str, nonce: str, max_payload_size=MAX_PAYLOAD_SIZE):
+        self._algorithm = algorithms.AES(bytes.fromhex(key))
+        self._backend = default_backend()
+        self._header = bytes.fromhex(nonce)
+        self._allocate(max_payload_size)
+
+    def _allocate(self, max_payload_size):
+        # 多留一个分组，兼容要求 len(data) + block_size - 1 的 update_into 实现
+        self._buffer = bytearray(HEADER_SIZE + max_payload_size + 16)
+        self._buffer[:HEADER_SIZE] = self._header
+        self._view = memoryview(self._buffer)
+        self._payload_view = self._view[HEADER_SIZE:]
+        self._max_payload_size = max_payload_size
+
+    def seal(self, payload, sequence):
+        size = len(payload)
+        if size > self._max_payload_size:
+            self._allocate(size)
+        buffer = self._buffer
+        struct.pack_into("!H", buffer, 2, size)
+        struct.pack_into("!I", buffer, 12, sequence)
+
+        cipher = Cipher(self._algorithm, modes.CTR(bytes(buffer[:HEADER_SIZE])), backend=self._backend)
+        encryptor = cipher.encryptor()
+        encryptor.update_into(payload, self._payload_view)
+        encryptor.finalize()
+        return self._view[:HEADER_SIZE + size]
+
+
+class PacketOpener:
+    """
+    下行 UDP 包解密器，key 只解析一次，整个会话复用一个解密上下文，每个包用 reset_nonce()
+    换成包头里的 nonce，直接在接收缓冲区里原地解密.
+    """
+
+    def __init__(self, key: str):
+        cipher = Cipher(algorithms.AES(bytes.fromhex(key)), modes.CTR(bytes(HEADER_SIZE)), backend=default_backend())
+        self._decryptor = cipher.decryptor()
+
+    def open(self, view, size):
+        """view 是接收缓冲区，后面至少多留一个分组；返回的 payload 指向 view."""
+        return self.decrypt(view[:HEADER_SIZE], view[HEADER_SIZE:], size - HEADER_SIZE)
+
+    def decrypt(self, nonce, body, size):
+        """body 是包头之后的缓冲区，前 size 字节原地解密后返回；缓冲区可以预先切好反复使用."""
+        decryptor = self._decryptor
+        decryptor.reset_nonce(nonce)
+        payload = body[:size]
+        decryptor.update_into(payload, body)
+        return payload
@@ -0,0 +1,73 @@
+import collections
+import logging
+
+from queues import DROP_NEWEST, SerialWorker, check_overflow
+
+logger = logging.getLogger(__name__)
+
+
+class UplinkPipeline:
+    """
+    麦克风音频上行流水线.
+
+    PortAudio 回调里只调用 push()，把 in_data 放进有界的 deque (CPython 下 append/popleft
+    是原子操作，不需要额外加锁)；专门的工作线程取出后交给 handler 做预录/排队、
+    opus 编码、加密和发送. 队列满时按 overflow 策略丢弃并计数.
+
+    传入 executor 时不起专门的线程，队列由共享线程池里的任务排空 (fleet 模式里多台设备共用)，
+    同一条流水线同时最多只有一个任务，保证编码顺序.
+    """
+
+    def __init__(self, handler, uplink: dict, executor=None):
+        self.handler = handler
+        self.max_chunks = uplink['queue_chunks']
+        self.overflow = check_overflow(uplink['overflow'])
+        self._queue = collections.deque()
+        self.worker = SerialWorker(self._process, lambda: not self._queue, executor=executor)
+        self.pushed = 0
+        self.dropped = 0
+        self.processed = 0
+        self.max_depth = 0
+
+    @property
+    def stats(self):
+        return {
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "pushed": self.pushed,
+            "dropped": self.dropped,
+            "processed": self.processed,
+        }
+
+    def start(self):
+        self.worker.start()
+
+    def stop(self):
+        self.worker.stop()
+
+    def push(self, pcm):
+        self.pushed += 1
+        if len(self._queue) >= self.max_chunks:
+            self.dropped += 1
+            if self.overflow == DROP_NEWEST:
+                return
+            try:
+                self._queue.popleft()
+            except IndexError:
+                # 工作线程刚好取空了队列
+                pass
+        self._queue.append(pcm)
+        self.worker.notify()
+
+    def _process(self):
+        queue = self._queue
+        depth = len(queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        while queue:
+            pcm = queue.popleft()
+            try:
+                self.handler(pcm)
+            except Exception as e:
+                logger.warning("uplink handler error %s", e)
+            self.processed += 1
@@ -0,0 +1,41 @@
+import audioop
+
+
+class EnergyVad:
+    """
+    能量 + 过零率的轻量 VAD.
+
+    噪声底噪用指数平均跟踪，RMS 超过 max(energy_threshold, 底噪 * noise_ratio)
+    且过零率不像白噪声时判为语音，语音结束后保持 hangover_ms 再关闭.
+    """
+
+    def __init__(self, energy_threshold=300, noise_ratio=3.0, max_zero_crossing_rate=0.35,
+                 hangover_ms=300, sample_rate=16000, sample_width=2):
+        self.energy_threshold = energy_threshold
+        self.noise_ratio = noise_ratio
+        self.max_zero_crossing_rate = max_zero_crossing_rate
+        self.hangover_ms = hangover_ms
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.noise_floor = float(energy_threshold) / noise_ratio
+        self._hangover = 0.0
+
+    def is_speech(self, pcm) -> bool:
+        samples = len(pcm) // self.sample_width
+        if samples == 0:
+            return False
+        duration_ms = samples * 1000 / self.sample_rate
+        rms = audioop.rms(pcm, self.sample_width)
+        zero_crossing_rate = audioop.cross(pcm, self.sample_width) / samples
+        threshold = max(self.energy_threshold, self.noise_floor * self.noise_ratio)
+        if rms >= threshold and zero_crossing_rate <= self.max_zero_crossing_rate:
+            self._hangover = self.hangover_ms
+            return True
+        self.noise_floor += (rms - self.noise_floor) * 0.05
+        if self._hangover > 0:
+            self._hangover -= duration_ms
+            return True
+        return False
+
+    def reset(self):
+        self._hangover = 0.0
@@ -18,18 +18,26 @@ class DeviceFingerprint:
 
     _instance = None
 
-    def __new__(cls):
+    def __new__(cls, efuse_file: Optional[str] = None, mac_address: Optional[str] = None):
         """
-        确保单例模式.
+        确保单例模式；指定 efuse_file 时(fleet 模式的虚拟设备)每次创建新实例.
         """
+        if efuse_file is not None:
+            instance = super().__new__(cls)
+            instance._initialized = False
+            return instance
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance._initialized = False
         return cls._instance
 
-    def __init__(self):
+    def __init__(self, efuse_file: Optional[str] = None, mac_address: Optional[str] = None):
         """
         初始化设备指纹收集器.
+
+        Args:
+            efuse_file: efuse 文件路径，默认 config/efuse.json
+            mac_address: 覆盖网卡 MAC 地址，用于虚拟设备
         """
         if self._initialized:
             return
@@ -37,17 +45,22 @@ class DeviceFingerprint:
 
         self.system = platform.system()
         self._efuse_cache: Optional[Dict] = None  # efuse数据缓存
+        self._mac_address = mac_address
 
         # 初始化文件路径
-        self._init_file_paths()
+        self._init_file_paths(efuse_file)
 
         # 确保efuse文件在初始化时就存在且完整
         self._ensure_efuse_file()
 
-    def _init_file_paths(self):
+    def _init_file_paths(self, efuse_file: Optional[str] = None):
         """
         初始化文件路径.
         """
+        if efuse_file is not None:
+            self.efuse_file = Path(efuse_file)
+            self.efuse_file.parent.mkdir(parents=True, exist_ok=True)
+            return
 
         config_path = Path("config")
         config_path.mkdir(parents=True, exist_ok=True)
@@ -90,6 +103,8 @@ class DeviceFingerprint:
         """
         获取主要网卡的MAC地址.
         """
+        if self._mac_address:
+            return self._mac_address
         try:
             # 获取所有网络接口的地址信息
             net_if_addrs = psutil.net_if_addrs()
@@ -476,6 +491,23 @@ class DeviceFingerprint:
             logger.error(f"生成HMAC签名失败: {e}")
             return None
 
+    @classmethod
+    def for_virtual_device(cls, efuse_dir: str, index: int) -> "DeviceFingerprint":
+        """
+        fleet 模式的第 index 台虚拟设备，身份保存在 efuse_dir/efuse_<index>.json.
+
+        MAC 地址是本地管理地址 02:xx:xx 加上序号，xx:xx 取自本机 machine id，
+        不同主机上跑的 fleet 不会撞号.
+        """
+        try:
+            host_id = machineid.id()
+        except Exception:
+            host_id = platform.node()
+        prefix = hashlib.sha256(host_id.encode("utf-8")).digest()[:2]
+        octets = b"\x02" + prefix + index.to_bytes(3, "big")
+        mac_address = ":".join(f"{octet:02x}" for octet in octets)
+        return cls(efuse_file=str(Path(efuse_dir) / f"efuse_{index}.json"), mac_address=mac_address)
+
     @classmethod
     def get_instance(cls) -> "DeviceFingerprint":
         """
@@ -0,0 +1,175 @@
+"""
+fleet 模式: 一个进程里运行多台虚拟设备，用作压测客户端或网关.
+
+每台设备有自己的 efuse 身份、MQTT 连接和 UDP 会话，麦克风换成循环播放的 WAV 或合成语音.
+所有设备共用一个事件循环和一个上行编码线程池. 启动时输出启动耗时和每台设备的内存，
+运行期间定期输出状态分布、CPU 和按当前负载估算的每核设备数.
+
+    python fleet.py --devices 50 --duration 300
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import random
+import time
+
+import psutil
+
+from client import Client
+from config.load import read_config, resolve_env_vars
+from device.audio_source import FileSource, frame_bytes, load_wav, synthetic_speech
+from device.status import Status
+from device_fingerprint import DeviceFingerprint
+from logger import setup_logging
+from metrics import LatencyStats
+from protocol.event_loop import TransportLoop
+
+
+async def audio_clock(devices, frame_duration, silence):
+    """
+    所有设备共用一个按帧长走的时钟，聆听中的设备每帧送一块音频进上行流水线：
+    talk_until 之前是 source 里的语音，之后是静音，和真人说完话一样.
+    """
+    period = frame_duration / 1000
+    deadline = time.monotonic()
+    while True:
+        now = time.monotonic()
+        for device in devices:
+            if device.session.state == Status.Listening:
+                chunk = device.source.read_chunk() if now < device.talk_until else silence
+                device.session.uplink_pipeline.push(chunk)
+        deadline = max(deadline + period, now)
+        await asyncio.sleep(deadline - time.monotonic())
+
+
+class VirtualDevice:
+    def __init__(self, index, config, transport, executor, pcm):
+        self.index = index
+        self.source = FileSource(frame_bytes(config['audio']['opus']), pcm=pcm, offset=random.randrange(len(pcm)))
+        self.downlink_bytes = 0
+        self.wakes = 0
+        self.talk_until = 0.0
+        self.client = Client(
+            config, transport, output=self.on_audio,
+            fingerprint=DeviceFingerprint.for_virtual_device(config['fleet']['efuse_dir'], index),
+            executor=executor)
+        self.session = self.client.session
+
+    def on_audio(self, pcm):
+        self.downlink_bytes += len(pcm)
+
+
+class Fleet:
+    def __init__(self, config, transport, count):
+        self.config = config
+        self.fleet = config['fleet']
+        self.transport = transport
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.fleet['codec_workers'], thread_name_prefix="codec")
+        if self.fleet['audio_file']:
+            pcm = load_wav(self.fleet['audio_file'])
+        else:
+            pcm = synthetic_speech()
+        self.silence = bytes(frame_bytes(config['audio']['opus']))
+        self.devices = [VirtualDevice(index, config, transport, self.executor, pcm) for index in range(count)]
+        self.start_latency = LatencyStats("device_start")
+        self.started = []
+
+    async def start(self):
+        semaphore = asyncio.Semaphore(self.fleet['startup_concurrency'])
+
+        async def start_device(device):
+            async with semaphore:
+                begin = time.monotonic()
+                try:
+                    await device.client.start()
+                except Exception as e:
+                    print(f"device {device.index} failed to start: {e}")
+                    return
+                self.start_latency.record(time.monotonic() - begin)
+                device.session.uplink_pipeline.start()
+                self.started.append(device)
+
+        await asyncio.gather(*(start_device(device) for device in self.devices))
+        loop = asyncio.get_running_loop()
+        loop.create_task(audio_clock(self.started, self.config['audio']['opus']['frame_duration'], self.silence))
+        for device in self.started:
+            loop.create_task(self._wake_loop(device))
+
+    async def _wake_loop(self, device):
+        interval = self.fleet['wake_interval']
+        hello_timeout = self.config['session']['hello_timeout']
+        loop = asyncio.get_running_loop()
+        # 错开各设备的第一次唤醒
+        await asyncio.sleep(random.uniform(0, interval))
+        while True:
+            if device.session.state == Status.Idle:
+                device.talk_until = time.monotonic() + self.fleet['talk_seconds']
+                # 等 hello 完成放到默认线程池里，不阻塞事件循环
+                if device.client.wake() and await loop.run_in_executor(None, device.session.ready.wait, hello_timeout):
+                    device.wakes += 1
+            await asyncio.sleep(interval)
+
+    def stop(self):
+        for device in self.started:
+            device.session.uplink_pipeline.stop()
+            device.client.stop()
+        self.executor.shutdown()
+
+    def report(self, process, elapsed):
+        states = {}
+        for device in self.started:
+            states[device.session.state.name] = states.get(device.session.state.name, 0) + 1
+        cpu = process.cpu_percent()
+        uplink = sum(device.session.uplink_pipeline.processed for device in self.started)
+        downlink = sum(device.downlink_bytes for device in self.started)
+        wakes = sum(device.wakes for device in self.started)
+        line = (f"[{elapsed:6.0f}s] devices={len(self.started)} {states} wakes={wakes} "
+                f"uplink_chunks={uplink} downlink_bytes={downlink} cpu={cpu:.0f}%")
+        if cpu > 0:
+            line += f" devices/core~{len(self.started) * 100 / cpu:.0f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many virtual xiaozhi devices in one process")
+    parser.add_argument("--config_path", type=str, default="./config/default.yml")
+    parser.add_argument("--devices", type=int, help="覆盖 fleet.devices")
+    parser.add_argument("--duration", type=float, default=0, help="运行秒数，0 表示一直运行")
+    parser.add_argument("--report_interval", type=float, default=10)
+    args = parser.parse_args()
+
+    config = resolve_env_vars(read_config(args.config_path))
+    setup_logging(config['logger'])
+    count = args.devices or config['fleet']['devices']
+
+    process = psutil.Process()
+    transport = TransportLoop()
+    transport.start()
+    rss_before = process.memory_info().rss
+    begin = time.monotonic()
+    fleet = Fleet(config, transport, count)
+    transport.run(fleet.start())
+    startup = time.monotonic() - begin
+    rss_after = process.memory_info().rss
+
+    started = len(fleet.started)
+    print(f"started {started}/{count} devices in {startup:.2f} s, "
+          f"per device {fleet.start_latency.summary()}")
+    if started:
+        print(f"rss {rss_after / 2**20:.1f} MiB, {(rss_after - rss_before) / started / 2**10:.0f} KiB per device")
+
+    process.cpu_percent()
+    begin = time.monotonic()
+    try:
+        while not args.duration or time.monotonic() - begin < args.duration:
+            time.sleep(args.report_interval)
+            fleet.report(process, time.monotonic() - begin)
+    except KeyboardInterrupt:
+        pass
+    fleet.stop()
+    transport.stop()
+
+
+if __name__ == '__main__':
+    main()
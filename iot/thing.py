@@ -0,0 +1,77 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Property:
+    def __init__(self, description: str, type: str, getter):
+        self.description = description
+        self.type = type
+        self.getter = getter
+
+
+class Method:
+    def __init__(self, description: str, parameters: dict, callback):
+        self.description = description
+        # 参数名 -> (描述, 类型)
+        self.parameters = parameters
+        self.callback = callback
+
+
+class Thing:
+    """
+    可以被服务端控制的 IoT 设备，在构造时声明一次属性和方法.
+
+    属性值由 getter 读取；值变化后调用 changed()，由 ThingManager 合并后上报增量.
+    """
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.properties = {}
+        self.methods = {}
+        self.manager = None
+
+    def add_property(self, name: str, description: str, type: str, getter):
+        self.properties[name] = Property(description, type, getter)
+
+    def add_method(self, name: str, description: str, parameters: dict, callback):
+        self.methods[name] = Method(description, parameters, callback)
+
+    def changed(self):
+        if self.manager is not None:
+            self.manager.notify_changed()
+
+    def descriptor(self) -> dict:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "properties": {
+                name: {"description": prop.description, "type": prop.type}
+                for name, prop in self.properties.items()
+            },
+            "methods": {
+                name: {
+                    "description": method.description,
+                    "parameters": {
+                        param: {"description": description, "type": type}
+                        for param, (description, type) in method.parameters.items()
+                    },
+                }
+                for name, method in self.methods.items()
+            },
+        }
+
+    def state(self) -> dict:
+        return {name: prop.getter() for name, prop in self.properties.items()}
+
+    def invoke(self, method: str, parameters: dict):
+        target = self.methods.get(method)
+        if target is None:
+            logger.warning("%s 没有方法 %s", self.name, method)
+            return
+        missing = [name for name in target.parameters if name not in parameters]
+        if missing:
+            logger.warning("%s.%s 缺少参数 %s", self.name, method, missing)
+            return
+        target.callback(**{name: parameters[name] for name in target.parameters})
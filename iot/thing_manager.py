@@ -0,0 +1,80 @@
+import logging
+import threading
+
+from protocol import messages
+
+logger = logging.getLogger(__name__)
+
+
+class ThingManager:
+    """
+    IoT 设备注册表.
+
+    descriptors 在注册后编译成消息模板，每个会话只拼接 session_id；
+    服务端下发的 commands 分发到对应设备的方法；状态只上报和上次发送相比变化了的属性，
+    coalesce 秒内的多次变化合并成一次 on_changed 回调.
+    """
+
+    def __init__(self, transport, coalesce: float = 0.2):
+        self.transport = transport
+        self.coalesce = coalesce
+        self.things = {}
+        self.on_changed = None
+        self._descriptors = None
+        self._session_id = None
+        self._sent = {}
+        self._pending = False
+        self._lock = threading.Lock()
+
+    def add(self, thing):
+        thing.manager = self
+        self.things[thing.name] = thing
+        self._descriptors = None
+
+    @property
+    def descriptors(self) -> messages.MessageTemplate:
+        if self._descriptors is None:
+            self._descriptors = messages.iot_descriptors(
+                [thing.descriptor() for thing in self.things.values()])
+        return self._descriptors
+
+    def states_delta(self, session_id) -> list:
+        """
+        返回需要上报的状态，并记为已发送. 服务端的设备状态跟着会话走，新会话发送全部状态.
+        """
+        with self._lock:
+            if session_id != self._session_id:
+                self._session_id = session_id
+                self._sent = {}
+            states = []
+            for name, thing in self.things.items():
+                sent = self._sent.setdefault(name, {})
+                delta = {key: value for key, value in thing.state().items()
+                         if key not in sent or sent[key] != value}
+                if delta:
+                    sent.update(delta)
+                    states.append({"name": name, "state": delta})
+            return states
+
+    def invoke(self, command: dict):
+        thing = self.things.get(command.get('name'))
+        if thing is None:
+            logger.warning("未知的 IoT 设备 %s", command.get('name'))
+            return
+        try:
+            thing.invoke(command.get('method'), command.get('parameters') or {})
+        except Exception as e:
+            logger.warning("IoT 命令 %s 执行失败 %s", command, e)
+
+    def notify_changed(self):
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        self.transport.call_later(self.coalesce, self._flush)
+
+    def _flush(self):
+        with self._lock:
+            self._pending = False
+        if self.on_changed is not None:
+            self.on_changed()
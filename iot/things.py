@@ -0,0 +1,32 @@
+from iot.thing import Thing
+
+
+class Speaker(Thing):
+    def __init__(self, volume: int = 0, on_volume=None):
+        super().__init__("Speaker", "当前 AI 机器人的扬声器")
+        self.volume = volume
+        self.on_volume = on_volume
+        self.add_property("volume", "当前音量值", "number", lambda: self.volume)
+        self.add_method("SetVolume", "设置音量", {"volume": ("0到100之间的整数", "number")}, self.set_volume)
+
+    def set_volume(self, volume):
+        volume = max(0, min(100, int(volume)))
+        if volume != self.volume:
+            self.volume = volume
+            if self.on_volume is not None:
+                self.on_volume(volume)
+            self.changed()
+
+
+class Lamp(Thing):
+    def __init__(self):
+        super().__init__("Lamp", "一个测试用的灯")
+        self.power = False
+        self.add_property("power", "灯是否打开", "boolean", lambda: self.power)
+        self.add_method("TurnOn", "打开灯", {}, lambda: self.set_power(True))
+        self.add_method("TurnOff", "关闭灯", {}, lambda: self.set_power(False))
+
+    def set_power(self, power: bool):
+        if power != self.power:
+            self.power = power
+            self.changed()
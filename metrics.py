@@ -0,0 +1,64 @@
+import collections
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RateMeter:
+    """
+    按时间窗口累计计数器，每个窗口结束时计算每秒速率并输出到日志.
+
+    只在单个线程里调用 add()，读取 totals/rates 不需要加锁.
+    """
+
+    def __init__(self, name: str, interval: float = 10.0):
+        self.name = name
+        self.interval = interval
+        self.totals = {}
+        self.rates = {}
+        self._window = {}
+        self._window_start = time.monotonic()
+
+    def add(self, field: str, value=1):
+        self.totals[field] = self.totals.get(field, 0) + value
+        self._window[field] = self._window.get(field, 0) + value
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= self.interval:
+            self.rates = {k: v / elapsed for k, v in self._window.items()}
+            self._window = dict.fromkeys(self._window, 0)
+            self._window_start = now
+            logger.debug("%s: %s", self.name,
+                         ", ".join(f"{k}={v:.1f}/s" for k, v in self.rates.items()))
+
+
+class LatencyStats:
+    """
+    保留最近 window 个样本的延迟统计，单位秒，summary() 输出毫秒.
+    """
+
+    def __init__(self, name: str, window: int = 1000):
+        self.name = name
+        self.count = 0
+        self.samples = collections.deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.samples.append(seconds)
+
+    def percentile(self, p: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": max(self.samples) * 1000,
+        }
@@ -1,6 +1,6 @@
+import copy
 import json
 import logging
-import requests
 import asyncio
 import aiohttp
 
@@ -9,12 +9,13 @@ from device_fingerprint import DeviceFingerprint
 logger = logging.getLogger(__name__)
 
 class OTA:
-    def __init__(self, ota: dict):
+    def __init__(self, ota: dict, fingerprint: DeviceFingerprint = None):
         self.url = ota['url']
-        self.data = ota['data']
-        self.deviceFingerprint = DeviceFingerprint.get_instance()
+        # 请求体里会写入本设备的 elf_sha256，多台设备不能共用同一个 dict
+        self.data = copy.deepcopy(ota['data'])
+        self.deviceFingerprint = fingerprint or DeviceFingerprint.get_instance()
 
-    def init_server_config(self):
+    async def init_server_config(self):
         headers = {
             'Device-Id': self.deviceFingerprint.get_mac_address_from_efuse(),
             'Client-Id': self.deviceFingerprint.get_client_id_from_efuse(),
@@ -24,18 +25,20 @@ class OTA:
         }
         self.data['application']['elf_sha256'] = self.deviceFingerprint.get_hmac_key()
         try:
-            response = requests.post(self.url, headers=headers, json=self.data)
-            if response.status_code == 200:
-                json_data = response.json()
-                logger.debug(f"OTA 请求成功: {json_data}")
-                if 'activation' in json_data:
-                    asyncio.run(self.activate(json_data['activation']['challenge'], json_data['activation']['code']))
-                return json_data
-            else:
-                logger.warning(f"OTA 请求失败，状态码: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"OTA 请求出错:", e)
-        return None
+            timeout = aiohttp.ClientTimeout(total=10)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.post(self.url, headers=headers, json=self.data) as response:
+                    if response.status != 200:
+                        logger.warning(f"OTA 请求失败，状态码: {response.status}")
+                        return None
+                    json_data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("OTA 请求出错: %s", e)
+            return None
+        logger.debug(f"OTA 请求成功: {json_data}")
+        if 'activation' in json_data:
+            await self.activate(json_data['activation']['challenge'], json_data['activation']['code'])
+        return json_data
 
     async def activate(self, challenge: str, code: str = None) -> bool:
         try:
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import random
+import socket
+import ssl
+import time
+
+import paho.mqtt.client as paho
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+
+class ResumableTLSContext(ssl.SSLContext):
+    """
+    记住上一次握手的 TLS 会话，重连时带上，服务端支持时省掉完整握手.
+
+    paho 自己调用 wrap_socket，没有传 session 的入口，所以在 context 里补上.
+    """
+
+    session = None
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if self.session is not None:
+            kwargs.setdefault("session", self.session)
+        return super().wrap_socket(sock, *args, **kwargs)
+
+
+def create_tls_context() -> ResumableTLSContext:
+    context = ResumableTLSContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_default_certs()
+    return context
+
+
+def backoff_delays(min_delay: float, max_delay: float):
+    """第一次立即重试，之后指数退避加全抖动，避免大量设备同时重连."""
+    yield 0
+    ceiling = min_delay
+    while True:
+        yield random.uniform(0, ceiling)
+        ceiling = min(max_delay, ceiling * 2)
+
+
+class ConnectionManager:
+    """
+    MQTT 连接的建立、断线重连和健康检查，在事件循环线程里运行.
+
+    断线后马上开始重连(不等下一次 loop_misc)，连接、TCP 和 TLS 握手放在线程池里；
+    用 MQTT keepalive 和 TCP keepalive 探测半开连接. 从断线到收到 CONNACK 的时间记在 reconnect_time.
+    """
+
+    def __init__(self, client: paho.Client, transport, host: str, port: int, connection: dict):
+        self.client = client
+        self.transport = transport
+        self.loop = transport.loop
+        self.host = host
+        self.port = port
+        self.keepalive = connection['keepalive']
+        self.min_delay = connection['reconnect_min_delay']
+        self.max_delay = connection['reconnect_max_delay']
+        self.connect_timeout = connection['connect_timeout']
+        self.tls = None
+        self.reconnect_time = LatencyStats("mqtt_reconnect")
+        self.reconnects = 0
+        self.tls_resumed = 0
+        self.closing = False
+        self._connected = None
+        self._disconnected_at = None
+        self._task = None
+
+    def use_tls(self):
+        self.tls = create_tls_context()
+        self.client.tls_set_context(self.tls)
+
+    async def connect(self):
+        self._connected = asyncio.Event()
+        # DNS、TCP 和 TLS 握手是阻塞的，放到线程池里，不卡住事件循环
+        await self.loop.run_in_executor(None, self.client.connect, self.host, self.port, self.keepalive)
+
+    def on_socket_open(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, self.keepalive // 3))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+    def on_connect(self):
+        """收到 CONNACK，返回这次是不是重连."""
+        sock = self.client.socket()
+        resumed = False
+        if self.tls is not None and isinstance(sock, ssl.SSLSocket):
+            resumed = sock.session_reused
+            self.tls_resumed += resumed
+            self.tls.session = sock.session
+        if self._connected is not None:
+            self._connected.set()
+        if self._disconnected_at is None:
+            return False
+        elapsed = time.monotonic() - self._disconnected_at
+        self._disconnected_at = None
+        self.reconnects += 1
+        self.reconnect_time.record(elapsed)
+        logger.info("MQTT 重连用时 %.0f ms, TLS 会话复用 %s", elapsed * 1000, resumed)
+        return True
+
+    def on_disconnect(self):
+        if self.closing:
+            return
+        if self._disconnected_at is None:
+            self._disconnected_at = time.monotonic()
+        if self._connected is not None:
+            self._connected.clear()
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        for attempt, delay in enumerate(backoff_delays(self.min_delay, self.max_delay), 1):
+            if delay:
+                await asyncio.sleep(delay)
+            if self.closing or self.client.is_connected():
+                return
+            try:
+                await self.loop.run_in_executor(None, self.client.reconnect)
+                await asyncio.wait_for(self._connected.wait(), self.connect_timeout)
+                return
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.warning("MQTT 第 %d 次重连失败 %s", attempt, str(e) or "CONNACK 超时")
+
+    def check(self):
+        """每秒调用一次: 处理 keepalive，发现断线(比如 PINGRESP 超时)时开始重连."""
+        if self._task is not None and not self._task.done():
+            # 重连在线程池里进行，期间不碰 paho 的状态
+            return
+        if self.client.loop_misc() == paho.MQTT_ERR_NO_CONN:
+            self.on_disconnect()
+
+    def close(self):
+        self.closing = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
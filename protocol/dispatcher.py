@@ -0,0 +1,126 @@
+import collections
+import json
+import logging
+import time
+
+from metrics import LatencyStats
+from queues import SerialWorker
+
+logger = logging.getLogger(__name__)
+
+
+def json_loads(backend: str):
+    """auto 在装了 orjson 时用 orjson，否则用标准库 json；两者都直接接受 bytes."""
+    if backend in ("auto", "orjson"):
+        try:
+            import orjson
+            return orjson.loads
+        except ImportError:
+            if backend == "orjson":
+                raise
+    elif backend != "json":
+        raise ValueError(f"unknown json backend: {backend}")
+    return json.loads
+
+
+class Message:
+    """服务端下发的一条消息，常用字段解析成属性，其余字段用 message['key'] 读取."""
+
+    __slots__ = ("type", "state", "session_id", "data", "received")
+
+    def __init__(self, data: dict, received: float):
+        self.data = data
+        self.type = data.get('type')
+        self.state = data.get('state')
+        self.session_id = data.get('session_id')
+        self.received = received
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __repr__(self):
+        return f"Message({self.data})"
+
+
+class Dispatcher:
+    """
+    MQTT 消息分发.
+
+    on_message 在网络线程(事件循环)里只做 JSON 解析，解析好的 Message 按到达顺序交给
+    handler 线程执行，handler 里的耗时操作不会卡住后面的 MQTT 消息.
+    handler 按 type 注册，也可以按 (type, state) 注册，后者优先.
+
+    传入 executor 时不起专门的线程，由共享线程池里的任务排空队列，同一个 Dispatcher
+    同时最多只有一个任务，保证处理顺序.
+    """
+
+    def __init__(self, dispatch: dict, executor=None):
+        self.loads = json_loads(dispatch['json'])
+        self.handlers = {}
+        self.default = None
+        self.latency = {}
+        self.queue_wait = LatencyStats("dispatch_wait")
+        self.invalid = 0
+        self._queue = collections.deque()
+        self.worker = SerialWorker(self._process, lambda: not self._queue, executor=executor)
+
+    def register(self, type: str, handler, state=None):
+        self.handlers[(type, state)] = handler
+
+    def start(self):
+        self.worker.start()
+
+    def stop(self):
+        self.worker.stop()
+
+    @property
+    def stats(self):
+        stats = {type: latency.summary() for type, latency in self.latency.items()}
+        stats["wait"] = self.queue_wait.summary()
+        stats["invalid"] = self.invalid
+        return stats
+
+    def on_message(self, client, userdata, msg):
+        try:
+            data = self.loads(msg.payload)
+        except ValueError as e:
+            self.invalid += 1
+            logger.warning("无法解析的消息 %s: %r", e, msg.payload[:100])
+            return
+        if not isinstance(data, dict):
+            self.invalid += 1
+            return
+        message = Message(data, time.monotonic())
+        logger.debug("on_message: %s", message)
+        self.post(self._handle, message)
+
+    def post(self, callback, *args):
+        """在 handler 线程里按顺序执行 callback，可以在任意线程调用."""
+        self._queue.append((callback, args))
+        self.worker.notify()
+
+    def _process(self):
+        queue = self._queue
+        while queue:
+            callback, args = queue.popleft()
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.warning("dispatch error %s", e)
+
+    def _handle(self, message: Message):
+        handler = (self.handlers.get((message.type, message.state))
+                   or self.handlers.get((message.type, None))
+                   or self.default)
+        if handler is None:
+            return
+        start = time.monotonic()
+        self.queue_wait.record(start - message.received)
+        handler(message)
+        latency = self.latency.get(message.type)
+        if latency is None:
+            latency = self.latency[message.type] = LatencyStats(f"handler_{message.type}")
+        latency.record(time.monotonic() - start)
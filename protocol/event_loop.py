@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import logging
+
+from protocol.timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    """
+    事件循环里的定时器句柄，cancel() 可以在任意线程调用.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.cancelled = False
+        self._handle = None
+
+    def _schedule(self, delay, callback, args):
+        if not self.cancelled:
+            self._handle = self.loop.call_later(delay, callback, *args)
+
+    def _cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def cancel(self):
+        self.cancelled = True
+        self.loop.call_soon_threadsafe(self._cancel)
+
+
+class TransportLoop:
+    """
+    网络 I/O 和定时器共用的 asyncio 事件循环，跑在单独的线程里.
+
+    UDP、MQTT socket、OTA HTTP 和会话定时器都在这个线程上执行；
+    音频线程(PortAudio 回调、上行工作线程、唤醒检测)只通过 call_soon/submit/call_later
+    这些线程安全的入口和它交互. 会话超时用 timers 这个时间轮.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.timers = TimerWheel()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+        self.loop.close()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        wheel = self.loop.create_task(self.timers.run())
+        self.loop.run_forever()
+        wheel.cancel()
+        self.loop.run_until_complete(asyncio.gather(wheel, return_exceptions=True))
+
+    def in_loop(self):
+        return threading.current_thread() is self.thread
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(self.loop)
+        self.loop.call_soon_threadsafe(timer._schedule, delay, callback, args)
+        return timer
+
+    def submit(self, coro):
+        """在事件循环里运行协程，返回 concurrent.futures.Future."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(_log_exception)
+        return future
+
+    def run(self, coro, timeout=None):
+        """从其他线程运行协程并等待结果，不能在事件循环线程里调用."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+def _log_exception(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("transport task error %s", future.exception())
@@ -0,0 +1,129 @@
+"""
+MQTT 消息模板: 静态部分在导入时编码成 bytes，发送时只拼接 session_id 等动态字段，
+不再每次构造嵌套 dict 再 json.dumps.
+"""
+import json
+import json.encoder
+import re
+
+_SEPARATORS = (",", ":")
+_MARK = "\x00field:"
+# 占位符编码后是 "\u0000field:N"，控制字符一定会被转义，不会和正文冲突
+_PLACEHOLDER = re.compile(rb'"\\u0000field:(\d+)"')
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=_SEPARATORS)
+_encode_string = json.encoder.encode_basestring
+
+
+def encode(value) -> bytes:
+    """紧凑 JSON，中文不转义，UTF-8 编码."""
+    if type(value) is str:
+        return _encode_string(value).encode("utf-8")
+    return _encoder.encode(value).encode("utf-8")
+
+
+class Field:
+    """模板里的动态字段，render() 时按名字填入."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class MessageTemplate:
+    """
+    预编译的消息: static 是字段之间的 bytes 片段，fields 是依次填入的字段名.
+    """
+
+    def __init__(self, message: dict):
+        names = []
+
+        def mark(value):
+            if not isinstance(value, Field):
+                raise TypeError(f"不能编码 {type(value).__name__}")
+            names.append(value.name)
+            return f"{_MARK}{len(names) - 1}"
+
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=_SEPARATORS, default=mark)
+        data = encoder.encode(message).encode("utf-8")
+        pieces = _PLACEHOLDER.split(data)
+        self.static = pieces[0::2]
+        self.fields = [names[int(index)] for index in pieces[1::2]]
+
+    @classmethod
+    def _from_parts(cls, static, fields):
+        template = cls.__new__(cls)
+        template.static = static
+        template.fields = fields
+        return template
+
+    def bind(self, **values) -> "MessageTemplate":
+        """把一部分字段固定下来，返回新的模板，比如按配置生成的 audio_params."""
+        static = [self.static[0]]
+        fields = []
+        for name, piece in zip(self.fields, self.static[1:]):
+            if name in values:
+                static[-1] += encode(values[name]) + piece
+            else:
+                fields.append(name)
+                static.append(piece)
+        return MessageTemplate._from_parts(static, fields)
+
+    def render(self, **values) -> bytes:
+        if not self.fields:
+            return self.static[0]
+        static = self.static
+        parts = [static[0]]
+        for index, name in enumerate(self.fields, 1):
+            parts.append(encode(values[name]))
+            parts.append(static[index])
+        return b"".join(parts)
+
+
+HELLO = MessageTemplate({
+    "type": "hello",
+    "version": 3,
+    "transport": "udp",
+    "audio_params": Field("audio_params"),
+})
+
+WAKE_WORD_DETECTED = MessageTemplate({
+    "session_id": Field("session_id"),
+    "type": "listen",
+    "state": "detect",
+    "text": Field("wake_word"),
+})
+
+START_AUTO_LISTENING = MessageTemplate({
+    "session_id": Field("session_id"),
+    "type": "listen",
+    "state": "start",
+    "mode": "auto",
+})
+
+ABORT = MessageTemplate({
+    "session_id": Field("session_id"),
+    "type": "abort",
+    "reason": "wake_word_detected",
+})
+
+GOODBYE = MessageTemplate({
+    "session_id": Field("session_id"),
+    "type": "goodbye",
+})
+
+IOT_STATES = MessageTemplate({
+    "session_id": Field("session_id"),
+    "type": "iot",
+    "states": Field("states"),
+})
+
+
+def iot_descriptors(descriptors: list) -> MessageTemplate:
+    """设备描述只在注册时编译一次，发送时拼接 session_id."""
+    return MessageTemplate({
+        "session_id": Field("session_id"),
+        "type": "iot",
+        "descriptors": descriptors,
+    })
@@ -1,8 +1,12 @@
-import json
+import asyncio
 import logging
 import paho.mqtt.client as paho
 from paho.mqtt.enums import CallbackAPIVersion
 
+from protocol import messages
+from protocol.connection import ConnectionManager
+from protocol.publisher import Publisher
+
 logger = logging.getLogger(__name__)
 
 def _on_connect(client, userdata, flags, rc, properties=None):
@@ -15,145 +19,151 @@ def _on_disconnect(client, userdata, flags, rc, properties=None):
     logger.debug("与 Broker 断开连接，返回码=" + str(rc))
 
 class MqttProtocol:
-    def __init__(self, mqtt: dict):
+    """
+    MQTT 客户端，socket 读写挂在 TransportLoop 的事件循环上，不再单独起 paho 的 loop 线程.
+
+    on_message 回调在事件循环线程里执行；send_* 可以在任意线程调用，统一转到事件循环里
+    交给 Publisher，按消息类型选择 QoS，排队和限流.
+    """
+
+    def __init__(self, mqtt: dict, transport, config: dict):
         self.mqtt = mqtt
+        self.transport = transport
+        self.loop = transport.loop
         self.client = paho.Client(
             callback_api_version = CallbackAPIVersion.VERSION2,
             client_id=mqtt['client_id'],
-            reconnect_on_failure=True,
         )
             
+        # endpoint 可以带端口 host:port，默认 8883；本地压测的替身服务端用 tls: false 走明文
+        host, _, port = mqtt['endpoint'].partition(':')
+        self.connection = ConnectionManager(self.client, transport, host, int(port or 8883), config['connection'])
         self.client.username_pw_set(mqtt['username'], mqtt['password'])
-        self.client.tls_set(
-            ca_certs=None,
-            certfile=None,
-            keyfile=None,
-            cert_reqs=paho.ssl.CERT_REQUIRED,
-            tls_version=paho.ssl.PROTOCOL_TLS,
-        )
-        self.client.connect(mqtt['endpoint'], 8883)
-        self.client.loop_start()
-        self.client.on_connect = _on_connect
-        self.client.on_disconnect = _on_disconnect
-        # self.client.on_message = _on_message
-
-    def send_hello(self):
-        message = {
-            "type": "hello",
-            "version": 3,
-            "transport": "udp",
-            "audio_params": {
-                "format": "opus",
-                "sample_rate":16000,
-                "channels":1,
-                "frame_duration": 60
-            }
-        }
-        self.send_mqtt_message(message)
+        if mqtt.get('tls', True):
+            self.connection.use_tls()
+        # OTA 没有下发订阅主题时是 "null"
+        topic = mqtt.get('subscribe_topic')
+        self.subscribe_topic = topic if topic and topic != 'null' else None
+        # 重连成功后回调，由 Client 恢复进行中的会话
+        self.on_reconnect = None
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        publish = config['publish']
+        self.client.max_inflight_messages_set(publish['max_inflight'])
+        self.publisher = Publisher(self.client, mqtt['publish_topic'], publish)
+        self.client.on_publish = self.publisher.on_publish
+        # paho 在 connect/reconnect 所在的线程里回调这几个函数，统一转到事件循环里注册
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+        self._misc = None
+        self._hello = None
+        self._hello_params = None
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        _on_connect(client, userdata, flags, rc, properties)
+        if rc != 0:
+            return
+        reconnected = self.connection.on_connect()
+        # clean session 断线后订阅会丢，每次连上都重新订阅
+        if self.subscribe_topic is not None:
+            client.subscribe(self.subscribe_topic)
+        self.publisher.pump()
+        if reconnected and self.on_reconnect is not None:
+            self.on_reconnect()
+
+    def _on_disconnect(self, client, userdata, flags, rc, properties=None):
+        _on_disconnect(client, userdata, flags, rc, properties)
+        self.publisher.on_disconnect()
+        self.connection.on_disconnect()
+
+    def _in_loop(self, callback, *args):
+        if self.transport.in_loop():
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.connection.on_socket_open(sock)
+        self._in_loop(self.loop.add_reader, sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        # paho 回调之后马上关闭 socket，先取出 fd
+        fd = sock.fileno()
+        self._in_loop(self.loop.remove_reader, fd)
+        self._in_loop(self.loop.remove_writer, fd)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._in_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._in_loop(self.loop.remove_writer, sock.fileno())
+
+    async def start(self):
+        """连接 Broker，在事件循环里调用."""
+        await self.connection.connect()
+        self._misc = self.loop.create_task(self._misc_loop())
+
+    async def _misc_loop(self):
+        # 代替 loop_start 线程：每秒处理一次 keepalive，断线由 ConnectionManager 重连
+        while True:
+            await asyncio.sleep(1)
+            self.connection.check()
+
+    async def _disconnect(self):
+        self.connection.close()
+        if self._misc is not None:
+            self._misc.cancel()
+            self._misc = None
+        self.client.disconnect()
+
+    def disconnect(self):
+        self.transport.run(self._disconnect())
+
+    def send_hello(self, audio_params):
+        # audio_params 来自配置，基本不变，只在变化时重新编译
+        if audio_params != self._hello_params:
+            self._hello = messages.HELLO.bind(audio_params=audio_params)
+            self._hello_params = audio_params
+        self.publish("hello", self._hello.render())
 
     def send_wake_word_detected(self, session_id, wake_word):
-        message = {
-            "session_id": session_id,
-            "type": "listen",
-            "state": "detect",
-            "text": wake_word
-        }
-        self.send_mqtt_message(message)
+        self.publish("listen", messages.WAKE_WORD_DETECTED.render(session_id=session_id, wake_word=wake_word))
 
     def send_start_auto_listening(self, session_id):
-        message = {
-            "session_id": session_id,
-            "type": "listen",
-            "state": "start",
-            "mode": "auto",
-        }
-        self.send_mqtt_message(message)
-
-    def send_iot_descriptors(self, session_id):
-        message = {
-            "session_id": session_id,
-            "type": "iot",
-            "descriptors": [
-                {
-                    "name": "Speaker",
-                    "description": "当前 AI 机器人的扬声器",
-                    "properties": {
-                        "volume": {
-                        "description": "当前音量值",
-                        "type": "number"
-                        }
-                    },
-                    "methods": {
-                        "SetVolume": {
-                            "description": "设置音量",
-                            "parameters": {
-                                "volume": {
-                                "description": "0到100之间的整数",
-                                "type": "number"
-                                }
-                            }
-                        }
-                    }
-                },
-                {
-                    "name": "Lamp",
-                    "description": "一个测试用的灯",
-                    "properties": {
-                        "power": {
-                        "description": "灯是否打开",
-                        "type": "boolean"
-                        }
-                    },
-                    "methods": {
-                        "TurnOn": {
-                        "description": "打开灯",
-                        "parameters": {}
-                        },
-                        "TurnOff": {
-                        "description": "关闭灯",
-                        "parameters": {}
-                        }
-                    }
-                }
-         ]
-        }
-        self.send_mqtt_message(message)
-
-    def send_iot_states(self, session_id):
-        message = {
-            "session_id": session_id,
-            "type": "iot",
-            "states": [
-                {
-                    "name": "Speaker",
-                    "state": {
-                        "volume": 0
-                    }
-                },
-                {
-                    "name": "Lamp",
-                    "state": {
-                        "power": False
-                    }
-                }
-            ]
-        }
-        self.send_mqtt_message(message)
+        self.publish("listen", messages.START_AUTO_LISTENING.render(session_id=session_id))
+
+    def send_abort(self, session_id):
+        self.publish("abort", messages.ABORT.render(session_id=session_id))
+
+    def send_iot_descriptors(self, session_id, descriptors: messages.MessageTemplate):
+        self.publish("iot_descriptors", descriptors.render(session_id=session_id))
+
+    def send_iot_states(self, session_id, states):
+        """
+        states 是返回状态列表的函数，发送时才调用；排队期间的多次上报合并成一条，
+        发出去的总是最新的增量.
+        """
+        def render():
+            current = states()
+            if not current:
+                return None
+            return messages.IOT_STATES.render(session_id=session_id, states=current)
+        self.publish("iot_states", render, key="iot_states")
 
     def send_goodbye(self, session_id):
-        message = {
-            "session_id": session_id,
-            "type": "goodbye"
-        }
-        self.send_mqtt_message(message)
+        self.publish("goodbye", messages.GOODBYE.render(session_id=session_id))
 
     def send_mqtt_message(self, message):
-        publish_topic = self.mqtt['publish_topic']
-        res = self.client.publish(publish_topic, payload=json.dumps(message))
-        logger.info("publish_topic %s, send_mqtt_message, %s %s", publish_topic, res, json.dumps(message))
+        self.publish(message.get("type", "default"), messages.encode(message))
+
+    def publish(self, kind: str, payload, key=None):
+        """发送已经编码好的 JSON，可以在任意线程调用."""
+        self.loop.call_soon_threadsafe(self.publisher.enqueue, kind, payload, key)
 
     def on_message(self, callback):
         self.client.on_message = callback
 
-    def open_audio_channel(self):
-        self.send_hello()
+    def open_audio_channel(self, audio_params):
+        self.send_hello(audio_params)
@@ -0,0 +1,124 @@
+import collections
+import logging
+import time
+
+import paho.mqtt.client as paho
+
+from metrics import LatencyStats
+from queues import DROP_NEWEST, check_overflow
+
+logger = logging.getLogger(__name__)
+
+
+class Outgoing:
+    __slots__ = ("kind", "payload", "key", "enqueued")
+
+    def __init__(self, kind, payload, key):
+        self.kind = kind
+        self.payload = payload
+        self.key = key
+        self.enqueued = time.monotonic()
+
+
+class Publisher:
+    """
+    MQTT 发送队列，只在事件循环线程里调用.
+
+    消息先进有界队列，连接正常且在途消息少于 max_inflight 时才交给 paho；
+    在途指已经交给 paho、还没写出(QoS 0)或还没收到 PUBACK(QoS 1)的消息，
+    在 on_publish 里出队并记录从入队到完成的延迟. 断线期间消息留在队列里，连上后继续发送.
+
+    带 key 的消息在队列里只保留一条，新的覆盖旧的. payload 可以是函数，真正发送时才生成，
+    返回 None 表示不用发了.
+    """
+
+    def __init__(self, client: paho.Client, topic: str, publish: dict):
+        self.client = client
+        self.topic = topic
+        self.qos = publish['qos']
+        self.queue_size = publish['queue_size']
+        self.overflow = check_overflow(publish['overflow'])
+        self.max_inflight = publish['max_inflight']
+        self.queue = collections.deque()
+        self._keys = {}
+        self._inflight = {}
+        self.latency = LatencyStats("mqtt_publish")
+        self.max_depth = 0
+        self.published = 0
+        self.dropped = 0
+        self.merged = 0
+        self.lost = 0
+        self._full = False
+
+    @property
+    def stats(self):
+        return {
+            "depth": len(self.queue),
+            "max_depth": self.max_depth,
+            "inflight": len(self._inflight),
+            "published": self.published,
+            "dropped": self.dropped,
+            "merged": self.merged,
+            "lost": self.lost,
+            "latency": self.latency.summary(),
+        }
+
+    def enqueue(self, kind: str, payload, key=None):
+        if key is not None and key in self._keys:
+            self._keys[key].payload = payload
+            self.merged += 1
+            return
+        if len(self.queue) >= self.queue_size:
+            self.dropped += 1
+            if not self._full:
+                # 队列满了只告警一次，恢复发送后再告警
+                self._full = True
+                logger.warning("MQTT 发送队列已满(%d)，按 %s 丢弃消息", self.queue_size, self.overflow)
+            if self.overflow == DROP_NEWEST:
+                return
+            oldest = self.queue.popleft()
+            self._keys.pop(oldest.key, None)
+        entry = Outgoing(kind, payload, key)
+        self.queue.append(entry)
+        if key is not None:
+            self._keys[key] = entry
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self.pump()
+
+    def pump(self):
+        while self.queue and len(self._inflight) < self.max_inflight and self.client.is_connected():
+            entry = self.queue.popleft()
+            self._keys.pop(entry.key, None)
+            payload = entry.payload() if callable(entry.payload) else entry.payload
+            if payload is None:
+                continue
+            qos = self.qos.get(entry.kind, self.qos['default'])
+            info = self.client.publish(self.topic, payload=payload, qos=qos)
+            if info.rc != paho.MQTT_ERR_SUCCESS and qos == 0:
+                # QoS 0 没交出去，放回队首等重连；QoS 1 paho 会自己在重连后重发
+                entry.payload = payload
+                self.queue.appendleft(entry)
+                if entry.key is not None:
+                    # 之后同 key 的消息继续合并进这一条
+                    self._keys[entry.key] = entry
+                logger.warning("MQTT publish %s 失败 %s", entry.kind, paho.error_string(info.rc))
+                return
+            self._inflight[info.mid] = (entry, qos)
+            self._full = False
+            # 只有日志级别打开时才解码 payload
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("publish_topic %s, qos=%d mid=%d %s", self.topic, qos, info.mid, payload.decode("utf-8"))
+
+    def on_publish(self, client, userdata, mid, reason_code=None, properties=None):
+        item = self._inflight.pop(mid, None)
+        if item is not None:
+            self.published += 1
+            self.latency.record(time.monotonic() - item[0].enqueued)
+        self.pump()
+
+    def on_disconnect(self):
+        # 没写出去的 QoS 0 消息 paho 不会重发
+        lost = [mid for mid, (_, qos) in self._inflight.items() if qos == 0]
+        for mid in lost:
+            del self._inflight[mid]
+        self.lost += len(lost)
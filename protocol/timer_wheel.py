@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WheelTimer:
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        # 不从槽里移除，转到这个槽时丢掉
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    哈希时间轮，会话超时这类精度要求不高、经常取消的定时器用它.
+
+    schedule/cancel 都是 O(1)，可以在任意线程调用；回调在事件循环线程里执行，最多晚两个 tick.
+    超过一圈的定时器转到时按剩余时间重新放进槽里. 槽的位置按时间计算，run() 只睡到下一个
+    有定时器的槽，全部为空时一直等到有新的定时器，空闲时不会每个 tick 醒一次.
+    """
+
+    def __init__(self, tick: float = 0.05, slots: int = 256):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self._origin = time.monotonic()
+        # 已经处理过的 tick
+        self._position = 0
+        # run() 睡到的 tick 和唤醒它的 future，新定时器更早到期时提前唤醒
+        self._wake_at = math.inf
+        self._waiter = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def schedule(self, delay: float, callback, *args) -> WheelTimer:
+        timer = WheelTimer(time.monotonic() + delay, callback, args)
+        waiter = None
+        with self._lock:
+            position = self._insert_locked(timer, delay)
+            if position < self._wake_at and self._waiter is not None:
+                self._wake_at = position
+                waiter = self._waiter
+        if waiter is not None:
+            self._loop.call_soon_threadsafe(_wake, waiter)
+        return timer
+
+    def _ticks(self, now):
+        return int((now - self._origin) / self.tick)
+
+    def _insert_locked(self, timer, delay):
+        # 多算一个 tick: 刚好在 tick 之前加入的定时器，转到它的槽时不能还差一点没到期
+        ticks = max(1, math.ceil(delay / self.tick)) + 1
+        position = max(self._position, self._ticks(time.monotonic())) + ticks
+        self.slots[position % len(self.slots)].append(timer)
+        return position
+
+    def _next_locked(self):
+        for position in range(self._position + 1, self._position + len(self.slots) + 1):
+            if self.slots[position % len(self.slots)]:
+                return position
+        return math.inf
+
+    async def run(self):
+        self._loop = loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                self._wake_at = self._next_locked()
+                self._waiter = waiter = loop.create_future()
+            handle = None
+            if self._wake_at != math.inf:
+                delay = self._origin + self._wake_at * self.tick - time.monotonic()
+                handle = loop.call_later(max(0.0, delay), _wake, waiter)
+            try:
+                await waiter
+            finally:
+                if handle is not None:
+                    handle.cancel()
+            self._advance(self._ticks(time.monotonic()))
+
+    def _advance(self, until):
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            # 落后超过一圈时每个槽也只需要转一次
+            start = max(self._position, until - len(self.slots))
+            for position in range(start + 1, until + 1):
+                index = position % len(self.slots)
+                bucket, self.slots[index] = self.slots[index], []
+                self._position = position
+                for timer in bucket:
+                    if timer.cancelled:
+                        continue
+                    if timer.deadline <= now + self.tick / 2:
+                        due.append(timer)
+                    else:
+                        # 还没到期(超过一圈)，按剩余时间重新放
+                        self._insert_locked(timer, timer.deadline - now)
+            self._position = max(self._position, until)
+        for timer in due:
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                logger.warning("timer callback error %s", e)
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
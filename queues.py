@@ -0,0 +1,73 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 有界队列满了时的丢弃策略
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+def check_overflow(policy: str) -> str:
+    if policy not in (DROP_OLDEST, DROP_NEWEST):
+        raise ValueError(f"未知的 overflow 策略 {policy}")
+    return policy
+
+
+class SerialWorker:
+    """
+    按顺序排空一个队列的工作者，上行流水线和消息分发共用.
+
+    生产者往队列里放好数据后调用 notify()，可以在任意线程调用. 没有 executor 时起专门的线程，
+    notify() 唤醒它调用 process()；传入 executor 时不起线程，由共享线程池里的任务排空
+    (fleet 模式里多台设备共用)，同一个 SerialWorker 同时最多只有一个任务，保证处理顺序.
+    process() 取空队列后返回，is_empty() 判断取空之后有没有新数据进来.
+    """
+
+    def __init__(self, process, is_empty, executor=None):
+        self.process = process
+        self.is_empty = is_empty
+        self.executor = executor
+        self._wakeup = threading.Event()
+        self._draining = False
+        self._draining_lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        if self.executor is not None:
+            return
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wakeup.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def notify(self):
+        if self.executor is None:
+            self._wakeup.set()
+            return
+        with self._draining_lock:
+            if self._draining or not self.running:
+                return
+            self._draining = True
+        self.executor.submit(self._drain)
+
+    def _run(self):
+        while self.running:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self.process()
+
+    def _drain(self):
+        while True:
+            self.process()
+            with self._draining_lock:
+                if self.is_empty() or not self.running:
+                    self._draining = False
+                    return
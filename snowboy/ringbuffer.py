@@ -0,0 +1,103 @@
+import threading
+
+
+class RingBuffer(object):
+    """Fixed-capacity byte ring to hold audio from PortAudio.
+
+    Backed by a single preallocated bytearray, so writes and reads are bulk
+    slice copies instead of per-byte Python objects. When full, the oldest
+    bytes are overwritten, like a ``deque`` with ``maxlen``.
+    """
+
+    def __init__(self, size=4096):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._size = size
+        self._start = 0
+        self._len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def capacity(self):
+        return self._size
+
+    def extend(self, data):
+        """Adds data to the end of buffer, dropping the oldest bytes on overflow"""
+        data = memoryview(data).cast("B")
+        n = len(data)
+        size = self._size
+        with self._lock:
+            if n >= size:
+                self._buf[:] = data[n - size:]
+                self._start = 0
+                self._len = size
+                return
+            end = (self._start + self._len) % size
+            first = min(n, size - end)
+            self._buf[end:end + first] = data[:first]
+            if first < n:
+                self._buf[:n - first] = data[first:]
+            self._len += n
+            if self._len > size:
+                self._start = (self._start + self._len - size) % size
+                self._len = size
+
+    def _copy_out(self, out, offset, n):
+        # copies n bytes starting `offset` bytes after the read position
+        start = (self._start + offset) % self._size
+        first = min(n, self._size - start)
+        out[:first] = self._view[start:start + first]
+        if first < n:
+            out[first:n] = self._view[:n - first]
+
+    def _bytes(self, offset, n):
+        start = (self._start + offset) % self._size
+        first = min(n, self._size - start)
+        data = self._view[start:start + first].tobytes()
+        if first < n:
+            data += self._view[:n - first]
+        return data
+
+    def read_into(self, out):
+        """Moves up to len(out) bytes from the beginning of buffer into `out`.
+
+        :return: number of bytes copied
+        """
+        out = memoryview(out).cast("B")
+        with self._lock:
+            n = min(len(out), self._len)
+            self._copy_out(out, 0, n)
+            self._start = (self._start + n) % self._size
+            self._len -= n
+        return n
+
+    def read(self, n):
+        """Retrieves up to `n` bytes from the beginning of buffer"""
+        with self._lock:
+            n = min(n, self._len)
+            data = self._bytes(0, n)
+            self._start = (self._start + n) % self._size
+            self._len -= n
+        return data
+
+    def peek_last(self, n):
+        """Returns the newest `n` bytes (or fewer) without consuming them"""
+        with self._lock:
+            n = min(n, self._len)
+            return self._bytes(self._len - n, n)
+
+    def get(self):
+        """Retrieves data from the beginning of buffer and clears it"""
+        with self._lock:
+            data = self._bytes(0, self._len)
+            self._start = 0
+            self._len = 0
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._start = 0
+            self._len = 0
@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 
 import collections
+import threading
 import pyaudio
 from . import snowboydetect
+from .ringbuffer import RingBuffer
 import time
 import wave
 import os
@@ -36,23 +38,6 @@ def no_alsa_error():
         yield
         pass
 
-class RingBuffer(object):
-    """Ring buffer to hold audio from PortAudio"""
-
-    def __init__(self, size=4096):
-        self._buf = collections.deque(maxlen=size)
-
-    def extend(self, data):
-        """Adds data to the end of buffer"""
-        self._buf.extend(data)
-
-    def get(self):
-        """Retrieves data from the beginning of buffer and clears it"""
-        tmp = bytes(bytearray(self._buf))
-        self._buf.clear()
-        return tmp
-
-
 def play_audio_file(fname=DETECT_DING):
     """Simple callback function to play a wave file. By default it plays
     a Ding sound.
@@ -89,13 +74,33 @@ class HotwordDetector(object):
                               default sensitivity in the model will be used.
     :param audio_gain: multiply input volume by this factor.
     :param apply_frontend: applies the frontend processing algorithm if True.
+    :param vad: optional voice activity gate, an object with an
+                `is_speech(data)` method. Chunks it rejects are not passed
+                to the detector.
+    :param vad_lookback_ms: how much gated audio is replayed into the
+                            detector when the gate opens, so that the onset
+                            of the keyword is not clipped.
+    :param echo_reference: optional playback reference, an object with a
+                           `subtract(data, captured_at)` method. Each chunk
+                           has the speaker's own output subtracted before it
+                           reaches the VAD gate and the detector, so that the
+                           keyword can be detected while audio is playing.
+    :param echo_canceller: optional echo canceller, an object with a
+                           `process(data, captured_at)` method. It runs in
+                           the detection loop, not in the stream callback;
+                           the cleaned chunks feed both the detector and
+                           `audio_callback` in `start`.
     """
 
     def __init__(self, decoder_model,
                  resource=RESOURCE_FILE,
                  sensitivity=[],
                  audio_gain=1,
-                 apply_frontend=False):
+                 apply_frontend=False,
+                 vad=None,
+                 vad_lookback_ms=300,
+                 echo_reference=None,
+                 echo_canceller=None):
 
         tm = type(decoder_model)
         ts = type(sensitivity)
@@ -124,19 +129,65 @@ class HotwordDetector(object):
 
         self.ring_buffer = RingBuffer(
             self.detector.NumChannels() * self.detector.SampleRate() * 2)
-        self.ring_buffer_detected = RingBuffer(
-            self.detector.NumChannels() * self.detector.SampleRate() * 2)
+
+        # stream_callback notifies the detection loop once a full chunk is
+        # buffered; (stream position, monotonic time) pairs let the loop
+        # tell when the audio that triggered a detection was captured.
+        self._audio_ready = threading.Condition()
+        self._stream_position = 0
+        self._timestamps = collections.deque()
+        self.detection_latencies = collections.deque(maxlen=100)
+        self.last_detection_position = None
+
+        self.vad = vad
+        self._lookback = RingBuffer(
+            self.detector.NumChannels() * self.detector.SampleRate() *
+            self.detector.BitsPerSample() // 8 * vad_lookback_ms // 1000)
+        self._gate_open = True
+        self.echo_reference = echo_reference
+        self.echo_canceller = echo_canceller
+        self.gate_bytes_in = 0
+        self.gate_bytes_detected = 0
+
+    @property
+    def gate_duty_cycle(self):
+        """Fraction of the input audio that reached RunDetection"""
+        if self.gate_bytes_in == 0:
+            return 1.0
+        return self.gate_bytes_detected / self.gate_bytes_in
+
+    def detect_chunk(self, data):
+        """
+        Runs one chunk of audio through the VAD gate and the detector.
+
+        :return: the `RunDetection` status, or -2 (silence) if the gate
+                 kept the chunk away from the detector.
+        """
+        self.gate_bytes_in += len(data)
+        if self.vad is not None:
+            if not self.vad.is_speech(data):
+                self._lookback.extend(data)
+                self._gate_open = False
+                return -2
+            if not self._gate_open:
+                self._gate_open = True
+                self.detector.Reset()
+                data = self._lookback.get() + data
+        self.gate_bytes_detected += len(data)
+        return self.detector.RunDetection(data)
 
     def start(self, detected_callback=play_audio_file,
               interrupt_check=lambda: False,
-              sleep_time=0.03,
+              sleep_time=0.5,
               audio_recorder_callback=None,
               silent_count_threshold=15,
               recording_timeout=100,
-              audio_callback=None):
+              audio_callback=None,
+              chunk_ms=60):
         """
-        Start the voice detector. For every `sleep_time` second it checks the
-        audio buffer for triggering keywords. If detected, then call
+        Start the voice detector. Every time the stream callback has buffered
+        `chunk_ms` of audio it wakes the detection loop, which runs the chunk
+        through the detector to check for triggering keywords. If detected, then call
         corresponding function in `detected_callback`, which can be a single
         function (single model) or a list of callback functions (multiple
         models). Every loop it also calls `interrupt_check` -- if it returns
@@ -144,10 +195,13 @@ class HotwordDetector(object):
 
         :param detected_callback: a function or list of functions. The number of
                                   items must match the number of models in
-                                  `decoder_model`.
+                                  `decoder_model`. Callbacks take no
+                                  arguments; callers that need the audio
+                                  around the keyword keep it themselves.
         :param interrupt_check: a function that returns True if the main loop
                                 needs to stop.
-        :param float sleep_time: how much time in second every loop waits.
+        :param float sleep_time: how long in second to wait for new audio
+                                 before calling `interrupt_check` again.
         :param audio_recorder_callback: if specified, this will be called after
                                         a keyword has been spoken and after the
                                         phrase immediately after the keyword has
@@ -158,16 +212,24 @@ class HotwordDetector(object):
                                        to mark the end of a phrase that is
                                        being recorded.
         :param recording_timeout: limits the maximum length of a recording.
+        :param audio_callback: called with every buffer from the stream
+                               callback before it is queued for detection.
+                               With an echo canceller it is called from the
+                               detection loop instead, with each cleaned
+                               chunk.
+        :param chunk_ms: size in milliseconds of the audio chunks passed to
+                         `RunDetection`.
         :return: None
         """
         self._running = True
+        chunk_bytes = self.chunk_size(chunk_ms)
 
         def stream_callback(in_data, frame_count, time_info, status):
             # logger.info("detect voice return", len(in_data), frame_count, time_info, status)
-            if audio_callback is not None:
+            captured_at = time.monotonic()
+            if audio_callback is not None and self.echo_canceller is None:
                 audio_callback(in_data)
-            self.ring_buffer.extend(in_data)
-            self.ring_buffer_detected.extend(in_data)
+            self._buffer_audio(in_data, captured_at, chunk_bytes)
             # if audio_callback is not None:
             #     audio_callback(self.ring_buffer.get())
             play_data = chr(0) * len(in_data)
@@ -188,6 +250,58 @@ class HotwordDetector(object):
             logger.debug("detect voice return")
             return
 
+        detected_callback = self._callback_list(detected_callback)
+
+        logger.debug("detecting...")
+
+        while self._running is True:
+            if interrupt_check():
+                logger.debug("detect voice break")
+                break
+            with self._audio_ready:
+                if len(self.ring_buffer) < chunk_bytes:
+                    self._audio_ready.wait(sleep_time)
+                    continue
+                data = self.ring_buffer.read(chunk_bytes)
+                chunk_end, captured_at = self._locate_chunk()
+
+            self._handle_chunk(data, chunk_end, captured_at, detected_callback,
+                               audio_callback)
+
+        logger.debug("finished.")
+
+    def replay(self, audio_chunks, detected_callback=None, chunk_ms=60):
+        """
+        Runs recorded audio through the same ring buffer, detection and
+        state machine as `start`, without opening an audio device. Chunks are
+        processed as fast as the detector allows.
+
+        :param audio_chunks: iterable of raw audio buffers in the detector's
+                             sample format.
+        :param detected_callback: same as in `start`; None entries are allowed.
+        :param chunk_ms: size in milliseconds of the audio chunks passed to
+                         `RunDetection`.
+        :return: None
+        """
+        chunk_bytes = self.chunk_size(chunk_ms)
+        detected_callback = self._callback_list(detected_callback)
+        for in_data in audio_chunks:
+            self._buffer_audio(in_data, time.monotonic(), chunk_bytes)
+            while len(self.ring_buffer) >= chunk_bytes:
+                with self._audio_ready:
+                    data = self.ring_buffer.read(chunk_bytes)
+                    chunk_end, captured_at = self._locate_chunk()
+                self._handle_chunk(data, chunk_end, captured_at, detected_callback)
+
+    def bytes_to_seconds(self, size):
+        return size / (self.detector.SampleRate() * self.detector.NumChannels() *
+                       self.detector.BitsPerSample() // 8)
+
+    def chunk_size(self, chunk_ms):
+        return int(self.detector.SampleRate() * chunk_ms / 1000) * \
+            self.detector.NumChannels() * self.detector.BitsPerSample() // 8
+
+    def _callback_list(self, detected_callback):
         tc = type(detected_callback)
         if tc is not list:
             detected_callback = [detected_callback]
@@ -197,64 +311,91 @@ class HotwordDetector(object):
         assert self.num_hotwords == len(detected_callback), \
             "Error: hotwords in your models (%d) do not match the number of " \
             "callbacks (%d)" % (self.num_hotwords, len(detected_callback))
+        return detected_callback
 
-        logger.debug("detecting...")
-
-        while self._running is True:
-            if interrupt_check():
-                logger.debug("detect voice break")
-                break
-            data = self.ring_buffer.get()
-            if len(data) == 0:
-                time.sleep(sleep_time)
-                continue
-
-            status = self.detector.RunDetection(data)
-            if status == -1:
-                logger.warning("Error initializing streams or reading audio data")
-
-            #small state machine to handle recording of phrase after keyword
-            if self.state == "PASSIVE":
-                if status > 0: #key word found
-                    self.state = "ACTIVE"
-                    self.recordedData = []
-                    self.recordedData.append(data)
-                    silentCount = 0
-                    recordingCount = 0
-                    message = "Keyword " + str(status) + " detected at time: "
-                    message += time.strftime("%Y-%m-%d %H:%M:%S",
-                                         time.localtime(time.time()))
-                    logger.info(message)
-                    callback = detected_callback[status-1]
-                    if callback is not None:
-                        callback(self.ring_buffer_detected.get())
-
-                    # if audio_recorder_callback is not None:
-                    #     state = "ACTIVE"
-                    continue
+    def _buffer_audio(self, in_data, captured_at, chunk_bytes):
+        with self._audio_ready:
+            self.ring_buffer.extend(in_data)
+            self._stream_position += len(in_data)
+            self._timestamps.append((self._stream_position, captured_at))
+            if len(self.ring_buffer) >= chunk_bytes:
+                self._audio_ready.notify()
 
-            # elif state == "ACTIVE":
-            #     stopRecording = False
-            #     if recordingCount > recording_timeout:
-            #         stopRecording = True
-            #     elif status == -2: #silence found
-            #         if silentCount > silent_count_threshold:
-            #             stopRecording = True
-            #         else:
-            #             silentCount = silentCount + 1
-            #     elif status == 0: #voice found
-            #         silentCount = 0
-
-            #     if stopRecording == True:
-            #         fname = self.saveMessage()
-            #         audio_recorder_callback(fname)
-            #         state = "PASSIVE"
-            #         continue
-
-            #     recordingCount = recordingCount + 1
-            #     self.recordedData.append(data)
+    def _locate_chunk(self):
+        """
+        Stream position and capture time of the newest byte in the chunk just
+        read from `ring_buffer`. Must be called with `_audio_ready` held.
+        """
+        chunk_end = self._stream_position - len(self.ring_buffer)
+        while len(self._timestamps) > 1 and self._timestamps[0][0] < chunk_end:
+            self._timestamps.popleft()
+        return chunk_end, self._timestamps[0][1]
 
-        logger.debug("finished.")
+    def _cancel_echo(self, data, captured_at, audio_callback):
+        """
+        Runs the echo canceller on a chunk read from `ring_buffer`. The
+        cleaned audio goes to `audio_callback` and to the detector, so the
+        uplink and the detector see the same stream.
+        """
+        data = self.echo_canceller.process(data, captured_at)
+        if audio_callback is not None and data:
+            audio_callback(data)
+        return data
+
+    def _handle_chunk(self, data, chunk_end, captured_at, detected_callback,
+                      audio_callback=None):
+        if self.echo_canceller is not None:
+            data = self._cancel_echo(data, captured_at, audio_callback)
+        if self.echo_reference is not None:
+            data = self.echo_reference.subtract(data, captured_at)
+        status = self.detect_chunk(data)
+        if status == -1:
+            logger.warning("Error initializing streams or reading audio data")
+
+        #small state machine to handle recording of phrase after keyword
+        if self.state == "PASSIVE":
+            if status > 0: #key word found
+                self.state = "ACTIVE"
+                self.recordedData = []
+                self.recordedData.append(data)
+                silentCount = 0
+                recordingCount = 0
+                message = "Keyword " + str(status) + " detected at time: "
+                message += time.strftime("%Y-%m-%d %H:%M:%S",
+                                     time.localtime(time.time()))
+                logger.info(message)
+                callback = detected_callback[status-1]
+                latency = time.monotonic() - captured_at
+                self.detection_latencies.append(latency)
+                self.last_detection_position = chunk_end
+                logger.info("detection latency %.1f ms", latency * 1000)
+                if callback is not None:
+                    callback()
+
+                # if audio_recorder_callback is not None:
+                #     state = "ACTIVE"
+                return
+
+        # elif state == "ACTIVE":
+        #     stopRecording = False
+        #     if recordingCount > recording_timeout:
+        #         stopRecording = True
+        #     elif status == -2: #silence found
+        #         if silentCount > silent_count_threshold:
+        #             stopRecording = True
+        #         else:
+        #             silentCount = silentCount + 1
+        #     elif status == 0: #voice found
+        #         silentCount = 0
+
+        #     if stopRecording == True:
+        #         fname = self.saveMessage()
+        #         audio_recorder_callback(fname)
+        #         state = "PASSIVE"
+        #         return
+
+        #     recordingCount = recordingCount + 1
+        #     self.recordedData.append(data)
 
     def saveMessage(self):
         """
@@ -283,7 +424,9 @@ class HotwordDetector(object):
         self.stream_in.stop_stream()
         self.stream_in.close()
         self.audio.terminate()
-        self._running = False
+        with self._audio_ready:
+            self._running = False
+            self._audio_ready.notify()
 
     def restart(self):
         if self.state == "ACTIVE":